@@ -0,0 +1,103 @@
+from simulation_pool import runSimulations
+from math import sqrt
+import numpy as np
+import logging
+
+logger = logging.getLogger('inspyred.ec.adaptive_replication')
+
+def replicationStatistics(samples):
+    '''
+    Returns mean and standard error of the replications of each candidate.
+    With less than 3 replications the variance pooled over all the
+    candidates is used instead of the candidate's own one. Both are None for
+    a candidate without replications (all its simulations failed).
+    '''
+    pooled = [np.var(s, ddof=1) for s in samples if len(s) > 1]
+    pooled_var = np.mean(pooled) if len(pooled) > 0 else float('inf')
+    means = []
+    ses = []
+    for s in samples:
+        if len(s) == 0:
+            means.append(None)
+            ses.append(None)
+            continue
+        var = np.var(s, ddof=1) if len(s) > 2 else pooled_var
+        means.append(np.mean(s))
+        ses.append(sqrt(var / len(s)))
+    return means, ses
+
+def uncertainCandidates(means, ses, f2s, z):
+    '''
+    Indexes of the candidates whose membership of the non dominated front is
+    uncertain, and of the candidates that make it uncertain. Since the
+    liveability is exact, a candidate k can dominate a candidate i only if
+    its liveability is not lower, and then it does if it has more hibernated
+    queens: k certainly dominates i if its mean exceeds the one of i by at
+    least z standard errors of the difference, and possibly dominates it if
+    it doesn't fall short by z standard errors. A candidate certainly
+    dominated by another one is out of the front whatever its replications;
+    a candidate possibly dominated by some others but certainly by none is
+    uncertain, together with those others. The pairs whose dominance is
+    uncertain but doesn't change the front membership are not replicated.
+    '''
+    valid = np.array([i for i in range(len(means)) if means[i] is not None], dtype=int)
+    if len(valid) < 2:
+        return set()
+    mean = np.array([means[i] for i in valid], dtype=float)
+    se = np.array([ses[i] for i in valid], dtype=float)
+    f2 = np.array([f2s[i] for i in valid], dtype=float)
+    # [k, i]: candidate k against candidate i
+    difference = mean[:, np.newaxis] - mean[np.newaxis, :]
+    margin = z * np.sqrt(se[:, np.newaxis] ** 2 + se[np.newaxis, :] ** 2)
+    not_worse = f2[:, np.newaxis] >= f2[np.newaxis, :]
+    better = f2[:, np.newaxis] > f2[np.newaxis, :]
+    # identical results (e.g. the same candidate) don't dominate each other
+    identical = ~better & (difference == 0) & (f2[:, np.newaxis] == f2[np.newaxis, :])
+    certainly = not_worse & (difference >= margin) & ((difference > 0) | better)
+    possibly = not_worse & ~identical & (difference > -margin) & ~certainly
+    ambiguous = possibly & ~certainly.any(axis=0)[np.newaxis, :]
+    uncertain = ambiguous.any(axis=0) | ambiguous.any(axis=1)
+    return set(valid[uncertain].tolist())
+
+def adaptiveReplication(makeJob, num_candidates, f2s, seeds, generation, args):
+    '''
+    Racing of the replications of the simulations over the seeds.
+
+    Every candidate is simulated with the first args["initial_replications"]
+    seeds (default 2); then, in rounds, the candidates whose membership of
+    the non dominated front is uncertain (see uncertainCandidates) at
+    confidence args["replication_confidence"] (z value, default 1.96) are
+    simulated with one more seed, until no candidate is
+    uncertain or all the seeds are used. Failed simulations are not counted
+    as replications; a candidate whose initial simulations all failed has
+    mean None.
+
+    makeJob: function returning the utils.runModel arguments of a candidate index and a seed
+    num_candidates: number of candidates
+    f2s: liveability of the candidates
+    seeds: the seeds available for the replications
+    generation: current generation
+    args: dictionary of keyword arguments of the evaluator
+
+    Returns means, standard errors and number of replications of the candidates.
+    '''
+    initial = min(args.setdefault('initial_replications', 2), len(seeds))
+    z = args.setdefault('replication_confidence', 1.96)
+    samples = [[] for _ in range(num_candidates)]
+    # number of seeds used by each candidate, including the failed simulations
+    used = [0] * num_candidates
+    requests = [(i, s) for s in range(initial) for i in range(num_candidates)]
+    means, ses = [], []
+    while len(requests) > 0:
+        results = runSimulations([makeJob(i, seeds[s]) for i, s in requests], generation, args)
+        for (i, s), qty in zip(requests, results):
+            used[i] += 1
+            if qty is not None:
+                samples[i].append(qty)
+        means, ses = replicationStatistics(samples)
+        uncertain = uncertainCandidates(means, ses, f2s, z)
+        requests = [(i, used[i]) for i in sorted(uncertain) if used[i] < len(seeds)]
+
+    replications = [len(s) for s in samples]
+    logger.info('replications at generation {0}: {1} of {2} simulations'.format(generation, sum(used), num_candidates * len(seeds)))
+    return means, ses, replications
@@ -0,0 +1,104 @@
+import argparse
+import time
+from inspyred.ec import emo, terminators, variators
+from bumblebee_problem_gray import UrbanPollinator as UP_gray
+from bumblebee_problem_value import UrbanPollinator as UP_value
+from custom_nsga2 import CustomNSGA2
+from custom_variators import single_point_crossover, bit_flip_mutation, gaussian_mutation
+from fused_variation import FusedVariator
+from fast_nsga import fastNsgaReplacement, fastTournamentSelection
+from inspyred_utils import NumpyRandomWrapper
+import collections
+collections.Iterable = collections.abc.Iterable
+collections.Sequence = collections.abc.Sequence
+
+parser = argparse.ArgumentParser(description='Micro-benchmark of the overhead of a generation of the evolution, without simulations.')
+
+parser.add_argument('-a', dest='algorithm', action='store', choices=['gray', 'value'],
+                    help='Encoding: "gray" or "value". Default is "gray"', default='gray')
+parser.add_argument('-g', dest='generations', action='store', type=int,
+                    help='Number of generations. Default is 10', default=10)
+parser.add_argument('-n', dest='sizes', action='store', type=int, nargs='+',
+                    help='Population sizes. Default is 10 100 1000', default=[10, 100, 1000])
+parser.add_argument('-s', dest='seed', action='store', type=int,
+                    help='Seed to use. Default is 23', default=23)
+parser.add_argument('--fused-variation', dest='fused_variation', action='store_true',
+                    help='Use the fused variation (see fused_variation.py)')
+parser.add_argument('--bound-once', dest='bound_once', action='store_true',
+                    help='Bound the offspring once at the end of the variation')
+parser.add_argument('--fast-sorting', dest='fast_sorting', action='store_true',
+                    help='Use the NumPy replacer and selector (see fast_nsga.py)')
+parser.add_argument('--compact-population', dest='compact_population', action='store_true',
+                    help='Keep the population in NumPy arrays (see population_arrays.py)')
+
+VARIATORS = {
+    "gray": (
+        [variators.blend_crossover, single_point_crossover, single_point_crossover, single_point_crossover,
+         gaussian_mutation, bit_flip_mutation, bit_flip_mutation, bit_flip_mutation],
+        [{"blx_points": [0]}, {"spx_points": [1, 2, 3, 4, 5, 6, 7, 8]}, {"spx_points": [9,10,11,12,13,14,15,16]}, {"spx_points": [17,18,19]},
+         {"g_points": [0], "gaussian_stdev": 0.1}, {"bf_points": [1, 2, 3, 4, 5, 6, 7, 8]}, {"bf_points": [9,10,11,12,13,14,15,16]}, {"bf_points": [17,18,19]}],
+    ),
+    "value": (
+        [variators.blend_crossover, gaussian_mutation, gaussian_mutation],
+        [{"blx_points": [0, 1, 2, 3]}, {"g_points": [0], "gaussian_stdev": 0.1}, {"g_points": [1, 2, 3], "gaussian_stdev": 10}],
+    ),
+}
+
+PHASES = ['selection', 'variation', 'evaluation', 'replacement', 'archival', 'loop']
+
+def timed(function, totals, phase):
+    '''
+    Wraps an operator of the evolution to add its time to totals[phase].
+    '''
+    def timed_function(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            totals[phase] += time.perf_counter() - start
+    timed_function.__name__ = function.__name__
+    timed_function.preserves_candidates = getattr(function, 'preserves_candidates', False)
+    return timed_function
+
+def benchmark(problem, variator, variations_args, pop_size, generations, seed, bound_once=False, fast_sorting=False, compact_population=False):
+    '''
+    Seconds per generation spent in each phase of the evolution of pop_size
+    individuals, with the liveability in place of the simulated objective.
+    The "loop" phase is the time of the evolve loop itself (copies,
+    Individual objects, bookkeeping).
+    '''
+    def evaluator(candidates, args):
+        f2s = problem.getFitness2(candidates)
+        return [emo.Pareto([f2 * (1 + i % 7), f2]) for i, f2 in enumerate(f2s)]
+
+    totals = {phase: 0.0 for phase in PHASES}
+    algorithm = CustomNSGA2(NumpyRandomWrapper(seed))
+    algorithm.terminator = terminators.generation_termination
+    if isinstance(variator, list):
+        algorithm.variator = [timed(op, totals, 'variation') for op in variator]
+    else:
+        algorithm.variator = timed(variator, totals, 'variation')
+    if fast_sorting:
+        algorithm.replacer = fastNsgaReplacement
+        algorithm.selector = fastTournamentSelection
+    algorithm.selector = timed(algorithm.selector, totals, 'selection')
+    algorithm.replacer = timed(algorithm.replacer, totals, 'replacement')
+    algorithm.archiver = timed(algorithm.archiver, totals, 'archival')
+    start = time.perf_counter()
+    algorithm.evolve(generator=problem.generator, evaluator=timed(evaluator, totals, 'evaluation'), pop_size=pop_size,
+                     maximize=problem.maximize, bounder=problem.bounder, max_generations=generations, num_selected=pop_size,
+                     variations_args=variations_args, bound_once=bound_once, compact_population=compact_population, num_vars=0)
+    totals['loop'] = time.perf_counter() - start - sum(totals.values())
+    return {phase: seconds / (generations + 1) for phase, seconds in totals.items()}
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    problem = UP_gray() if args.algorithm == "gray" else UP_value()
+    variator, variations_args = VARIATORS[args.algorithm]
+    if args.fused_variation:
+        variator = FusedVariator(variator)
+    print('ms per generation')
+    print('pop_size' + ''.join('{0:>13}'.format(phase) for phase in PHASES + ['total']))
+    for pop_size in args.sizes:
+        seconds = benchmark(problem, variator, variations_args, pop_size, args.generations, args.seed, args.bound_once, args.fast_sorting, args.compact_population)
+        print('{0:8d}'.format(pop_size) + ''.join('{0:13.2f}'.format(seconds[phase] * 1e3) for phase in PHASES) + '{0:13.2f}'.format(sum(seconds.values()) * 1e3))
@@ -0,0 +1,64 @@
+import argparse
+import concurrent.futures as futures
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+from simulation_pool import warmWorker, workerContext
+
+parser = argparse.ArgumentParser(description='Measures the startup time of the command line and of the simulation workers.')
+
+parser.add_argument('-r', dest='repeats', action='store', type=int,
+                    help='Repetitions of every measure, the best one is reported. Default is 5', default=5)
+parser.add_argument('-t', dest='top', action='store', type=int,
+                    help='Number of slowest imports of main.py listed. Default is 10', default=10)
+
+def commandTime(command, repeats):
+    '''
+    Best wall clock time of a command run in a new process.
+    '''
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+def slowestImports(command, top):
+    '''
+    Modules with the longest cumulative import time (seconds, name) of a
+    Python command, from the output of -X importtime.
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + command, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    imports = []
+    for line in result.stderr.splitlines():
+        fields = line.split('|')
+        if line.startswith('import time:') and fields[1].strip().isdigit():
+            imports.append((int(fields[1]) / 1e6, fields[2].strip()))
+    return sorted(imports, reverse=True)[:top]
+
+def workerTime(context):
+    '''
+    Seconds to start a warmed simulation worker in the multiprocessing
+    context and get a result from it.
+    '''
+    start = time.perf_counter()
+    with futures.ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=warmWorker) as executor:
+        executor.submit(os.getpid).result()
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    print('command line (main.py -h): {0:.2f} s'.format(commandTime([sys.executable, 'main.py', '-h'], args.repeats)))
+    print('slowest imports of main.py (cumulative):')
+    for seconds, module in slowestImports(['main.py', '-h'], args.top):
+        print('{0:8.3f} s  {1}'.format(seconds, module))
+
+    print('worker start, spawned: {0:.2f} s'.format(min(workerTime(multiprocessing.get_context('spawn')) for _ in range(args.repeats))))
+    context = workerContext()
+    if context.get_start_method() == 'forkserver':
+        # the first worker waits for the fork server to start and preload the modules
+        first = workerTime(context)
+        print('worker start, fork server: {0:.2f} s the first one, {1:.2f} s the next ones'.format(
+            first, min(workerTime(context) for _ in range(args.repeats))))
@@ -0,0 +1,373 @@
+import argparse
+import collections
+import concurrent.futures as futures
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import Listener, Client
+import itertools
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+from simulation_pool import EvaluationBackend, warmWorker, workerContext
+
+logger = logging.getLogger('inspyred.ec.broker')
+
+# environment variable with the key shared by the broker and its workers
+AUTHKEY_VARIABLE = "POLLINATOR_BROKER_KEY"
+
+class WorkerLost(BrokenProcessPool):
+    pass
+
+class RemoteWorker(object):
+    """A worker process connected to the broker."""
+    def __init__(self, connection, address):
+        self.connection = connection
+        self.address = address
+        self.last_seen = time.monotonic()
+        self.tasks = set()
+        self.send_lock = threading.Lock()
+
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+
+class BrokerTask(object):
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = futures.Future()
+        self.requeues = 0
+        self.started = None
+        self.workers = set()
+
+class SimulationBroker(EvaluationBackend):
+    """Evaluation backend dispatching the simulations to worker processes
+    connected through sockets, on this machine or on other ones.
+
+    Workers connect with ``workerLoop`` (see ``python broker.py --help`` to
+    start them on another machine) and pull a task whenever they are idle,
+    so the faster machines run more simulations. With *steal*, when the
+    queue is empty an idle worker also runs a copy of the oldest simulation
+    under way on another worker, if it has been running for more than
+    twice the mean duration of a simulation (work stealing of the
+    stragglers); the first result wins, since the simulations are
+    deterministic.
+
+    Every worker sends a heartbeat each *heartbeat_interval* seconds: a
+    worker that disconnects or misses its heartbeats for
+    *heartbeat_timeout* seconds is dropped and its tasks are queued again,
+    at most *max_requeues* times, then their Futures get a WorkerLost
+    (a BrokenProcessPool, see simulation_pool.runJobs).
+
+    With *local_workers* the broker also starts that many worker processes
+    on this machine, respawning them if they exit.
+
+    Public Attributes:
+    - *address* -- (host, port) the broker listens on
+    - *authkey* -- key the workers must present
+    - *workers* -- the connected workers
+    - *restarts* -- number of times the tasks under way were abandoned
+    - *recycles* -- always 0, the remote workers are not recycled
+    - *requeued* -- number of tasks queued again after losing their worker
+
+    """
+    def __init__(self, address=('localhost', 0), authkey=None, local_workers=0, heartbeat_interval=5.0,
+                 heartbeat_timeout=30.0, max_requeues=2, steal=True):
+        self.authkey = authkey if authkey is not None else os.urandom(32)
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.max_requeues = max_requeues
+        self.steal = steal
+        super().__init__()
+        self.recycles = 0
+        self.requeued = 0
+        self.completed = 0
+        self.mean_duration = None
+        self.lock = threading.RLock()
+        self.queue = collections.deque()
+        self.tasks = {}
+        self.task_ids = itertools.count()
+        self.workers = []
+        self.idle = collections.deque()
+        self.closed = False
+        self.listener = Listener(address, authkey=self.authkey)
+        self.address = self.listener.address
+        logger.info('broker listening on {0}:{1}'.format(*self.address))
+
+        self.local_workers = []
+        self.num_local_workers = local_workers
+        self.context = workerContext()
+        for _ in range(local_workers):
+            self.startLocalWorker()
+
+        for target in (self.acceptLoop, self.monitorLoop):
+            threading.Thread(target=target, daemon=True).start()
+
+    @property
+    def max_cores(self):
+        return max(1, len(self.workers))
+
+    def startLocalWorker(self):
+        process = self.context.Process(target=workerLoop, args=(self.address, self.authkey, self.heartbeat_interval), daemon=True)
+        process.start()
+        self.local_workers.append(process)
+
+    def acceptLoop(self):
+        while not self.closed:
+            try:
+                connection = self.listener.accept()
+            except Exception:
+                # closed listener or failed authentication
+                if self.closed:
+                    return
+                continue
+            worker = RemoteWorker(connection, self.listener.last_accepted)
+            with self.lock:
+                self.workers.append(worker)
+            logger.info('worker connected from {0} ({1} workers)'.format(worker.address, len(self.workers)))
+            threading.Thread(target=self.receiveLoop, args=(worker,), daemon=True).start()
+
+    def receiveLoop(self, worker):
+        while True:
+            try:
+                message = worker.connection.recv()
+            except Exception:
+                # EOFError or OSError, or any error if the connection was closed by dropWorker
+                self.dropWorker(worker, 'disconnected')
+                return
+            with self.lock:
+                worker.last_seen = time.monotonic()
+                if message[0] == "ready":
+                    if worker in self.workers and worker not in self.idle:
+                        self.idle.append(worker)
+                elif message[0] in ("result", "error"):
+                    self.completeTask(worker, message[1], message[0] == "result", message[2])
+                    if worker in self.workers:
+                        self.idle.append(worker)
+                self.dispatch()
+
+    def monitorLoop(self):
+        while not self.closed:
+            time.sleep(min(1.0, self.heartbeat_interval))
+            now = time.monotonic()
+            with self.lock:
+                lost = [w for w in self.workers if now - w.last_seen > self.heartbeat_timeout]
+            for worker in lost:
+                self.dropWorker(worker, 'no heartbeat for {0:.0f} seconds'.format(now - worker.last_seen))
+            if not self.closed:
+                self.local_workers = [p for p in self.local_workers if p.is_alive()]
+                while len(self.local_workers) < self.num_local_workers:
+                    self.startLocalWorker()
+            with self.lock:
+                self.dispatch()
+
+    def completeTask(self, worker, task_id, success, value):
+        worker.tasks.discard(task_id)
+        task = self.tasks.get(task_id)
+        if task is None:
+            # a copy of a task already completed
+            return
+        del self.tasks[task_id]
+        for other in task.workers:
+            other.tasks.discard(task_id)
+        if task.future.done():
+            return
+        if success and task.started is not None:
+            self.completed += 1
+            duration = time.monotonic() - task.started
+            self.mean_duration = duration if self.mean_duration is None else self.mean_duration + (duration - self.mean_duration) / self.completed
+        if success:
+            task.future.set_result(value)
+        else:
+            task.future.set_exception(value)
+
+    def dropWorker(self, worker, reason):
+        with self.lock:
+            if worker not in self.workers:
+                return
+            self.workers.remove(worker)
+            if worker in self.idle:
+                self.idle.remove(worker)
+            if self.closed:
+                return
+            logger.warning('worker {0} dropped: {1} ({2} tasks lost)'.format(worker.address, reason, len(worker.tasks)))
+            for task_id in worker.tasks:
+                task = self.tasks.get(task_id)
+                if task is None:
+                    continue
+                task.workers.discard(worker)
+                if len(task.workers) > 0:
+                    # still running elsewhere
+                    continue
+                task.requeues += 1
+                if task.requeues > self.max_requeues:
+                    del self.tasks[task_id]
+                    task.future.set_exception(WorkerLost('task lost {0} times with its worker'.format(task.requeues)))
+                else:
+                    self.requeued += 1
+                    task.started = None
+                    self.queue.appendleft(task_id)
+            worker.tasks = set()
+            self.dispatch()
+        try:
+            worker.connection.close()
+        except OSError:
+            pass
+
+    def dispatch(self):
+        '''
+        Sends the queued tasks to the idle workers, and copies of the oldest
+        tasks under way if the queue is empty. To be called with the lock.
+        '''
+        while len(self.idle) > 0:
+            task_id = None
+            while len(self.queue) > 0:
+                candidate = self.queue.popleft()
+                if candidate in self.tasks and not self.tasks[candidate].future.done():
+                    task_id = candidate
+                    break
+            if task_id is None and self.steal and self.mean_duration is not None:
+                late = time.monotonic() - 2 * self.mean_duration
+                running = [(t.started, i) for i, t in self.tasks.items() if len(t.workers) == 1 and t.started is not None and t.started < late]
+                if len(running) > 0:
+                    task_id = min(running)[1]
+            if task_id is None:
+                return
+            worker = self.idle.popleft()
+            task = self.tasks[task_id]
+            try:
+                worker.send(("task", task_id, task.fn, task.args, task.kwargs))
+            except (OSError, ValueError):
+                threading.Thread(target=self.dropWorker, args=(worker, 'send failed'), daemon=True).start()
+                if task.started is None:
+                    self.queue.appendleft(task_id)
+                continue
+            if task.started is None:
+                task.started = time.monotonic()
+            task.workers.add(worker)
+            worker.tasks.add(task_id)
+
+    def submit(self, fn, *args, **kwargs):
+        task = BrokerTask(fn, args, kwargs)
+        with self.lock:
+            task_id = next(self.task_ids)
+            self.tasks[task_id] = task
+            self.queue.append(task_id)
+            self.dispatch()
+        return task.future
+
+    def restart(self):
+        '''
+        Cancels every task and disconnects the workers running one, so that
+        hung simulations are abandoned (the workers exit and the local ones
+        are respawned).
+        '''
+        with self.lock:
+            busy = [w for w in self.workers if len(w.tasks) > 0]
+            for task in self.tasks.values():
+                task.future.cancel()
+            self.tasks = {}
+            self.queue.clear()
+        for worker in busy:
+            self.dropWorker(worker, 'restart')
+        self.restarts += 1
+        logger.warning('broker restarted ({0} restarts)'.format(self.restarts))
+
+    def shutdown(self, wait=True):
+        self.closed = True
+        with self.lock:
+            workers = list(self.workers)
+        for worker in workers:
+            try:
+                worker.send(("stop",))
+            except (OSError, ValueError):
+                pass
+        self.listener.close()
+        for process in self.local_workers:
+            process.join(timeout=10 if wait else 0)
+            if process.is_alive():
+                process.terminate()
+
+def workerLoop(address, authkey, heartbeat_interval=5.0):
+    '''
+    Main loop of a worker process: it connects to the broker, then runs the
+    tasks it receives and sends back their results, with a heartbeat every
+    *heartbeat_interval* seconds. It exits with 0 when the broker stops it,
+    1 when the connection is lost and 2 when the broker can't be reached.
+    '''
+    warmWorker()
+    try:
+        connection = Client(tuple(address), authkey=authkey)
+    except (ConnectionRefusedError, OSError):
+        os._exit(2)
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            connection.send(message)
+
+    def heartbeat():
+        while True:
+            time.sleep(heartbeat_interval)
+            try:
+                send(("heartbeat",))
+            except (OSError, ValueError):
+                # the broker dropped this worker, also if it is running a hung simulation
+                os._exit(1)
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    send(("ready",))
+    while True:
+        try:
+            message = connection.recv()
+        except (EOFError, OSError):
+            os._exit(1)
+        if message[0] == "stop":
+            connection.close()
+            os._exit(0)
+        _, task_id, fn, args, kwargs = message
+        try:
+            reply = ("result", task_id, fn(*args, **kwargs))
+        except Exception as ex:
+            reply = ("error", task_id, ex)
+        try:
+            send(reply)
+        except (OSError, ValueError):
+            os._exit(1)
+
+def parseAddress(address):
+    host, port = address.rsplit(':', 1)
+    return host, int(port)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Starts worker processes for a SimulationBroker, the key is read from the ' + AUTHKEY_VARIABLE + ' environment variable')
+    parser.add_argument('address', help='HOST:PORT of the broker')
+    parser.add_argument('-p', '--processes', dest='processes', type=int, default=os.cpu_count(),
+                        help='Number of worker processes. Default is the number of CPUs')
+    parser.add_argument('--heartbeat', dest='heartbeat_interval', type=float, default=5.0,
+                        help='Seconds between two heartbeats. Default is 5')
+    parser.add_argument('--worker', dest='worker', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if authkey is None:
+        sys.exit('the ' + AUTHKEY_VARIABLE + ' environment variable must hold the key of the broker')
+
+    if args.worker:
+        workerLoop(parseAddress(args.address), authkey.encode(), args.heartbeat_interval)
+
+    # keep the worker processes alive until the broker can't be reached anymore
+    command = [sys.executable, os.path.abspath(__file__), args.address, '--heartbeat', str(args.heartbeat_interval), '--worker']
+    processes = [subprocess.Popen(command) for _ in range(args.processes)]
+    while len(processes) > 0:
+        time.sleep(1)
+        for i, process in enumerate(processes):
+            code = process.poll()
+            if code in (0, 2):
+                # stopped by the broker or broker unreachable
+                processes[i] = None
+            elif code is not None:
+                processes[i] = subprocess.Popen(command)
+        processes = [p for p in processes if p is not None]
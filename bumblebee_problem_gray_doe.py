@@ -1,9 +1,11 @@
 from inspyred.benchmarks import Benchmark
-from utils import grayCode, grayToDecimal, runModel, lhs_generator, getLiveability
+from utils import grayCode, grayToDecimal, lhs_generator, getLiveabilityBatch
+from gray_codec import decodeGrayCandidates
 from custom_bounder import Bounder
 from inspyred.ec import emo
 import math
-import concurrent.futures as futures
+from simulation_pool import runSimulations
+from multi_fidelity import screenFitness1
 
 class UrbanPollinator(Benchmark):
     """
@@ -46,59 +48,48 @@ class UrbanPollinator(Benchmark):
 
         return seq
         
+    def decode(self, candidate):
+        '''
+        Returns no_mow_pc, mowing_days, pesticide_days and flower_area_type of the candidate.
+        '''
+        return [
+            candidate[0],
+            grayToDecimal(candidate[1:9]),
+            grayToDecimal(candidate[9:17]),
+            grayToDecimal(candidate[17:20])
+        ]
+
     def evaluator(self, candidates, args):
         generation = args.setdefault('generation', 0)
         seed = args.setdefault('seed', 23)
-        max_cores = args.setdefault('max_cores', 8)
+        args.setdefault('max_cores', 8)
         fitness = []
-        f1s = self.getFitness1(candidates, generation, seed, max_cores)
         f2s = self.getFitness2(candidates)
+        if args.get('screening_fidelity') is not None:
+            f1s = screenFitness1(self.getFitness1, candidates, f2s, generation, seed, args)
+        else:
+            f1s = self.getFitness1(candidates, generation, seed, args)
         for i in range(len(candidates)):
-            fitness.append(emo.Pareto([f1s[i], f2s[i]]))
+            # a candidate whose simulations failed is excluded by the evolution
+            fitness.append(emo.Pareto([f1s[i], f2s[i]]) if f1s[i] is not None else None)
 
         return fitness
     
-    def getFitness1(self, candidates, generation, seed, max_cores=8):
-        fitness = []
-
-        # Multiprocessing
-        proc_res = []
-
-        with futures.ProcessPoolExecutor(max_workers=max_cores) as executor:
-            for c in candidates:
-                args = {
-                    "no_mow_pc": c[0],
-                    "mowing_days": grayToDecimal(c[1:9]),
-                    "pesticide_days": grayToDecimal(c[9:17]),
-                    "flower_area_type": grayToDecimal(c[17:20]),
-                    "seed": seed
-                }
-                proc_res.append(
-                    executor.submit(
-                        runModel, args, generation
-                    )
-                )
+    def getFitness1(self, candidates, generation, seed, args=None):
+        jobs = []
+        for c in candidates:
+            jobs.append({
+                "no_mow_pc": c[0],
+                "mowing_days": grayToDecimal(c[1:9]),
+                "pesticide_days": grayToDecimal(c[9:17]),
+                "flower_area_type": grayToDecimal(c[17:20]),
+                "seed": seed
+            })
 
-        for i in range(len(proc_res)):
-            try:
-                qty = proc_res[i].result()
-                fitness.append(qty)
-                print(f"Process {i} terminated correctly")
-            except Exception as ex:
-                print(f"Error in process {i}: [{ex}]")
-                fitness.append(0)
-            
-        return fitness
+        # Multiprocessing on the shared pool of the run
+        return runSimulations(jobs, generation, args)
     
     def getFitness2(self, candidates):
-        fitness = []
-        for c in candidates:
-            x1 = c[0] #no_mow_pc
-            x2 = grayToDecimal(c[1:9]) - 1 #mowing_days
-            x3 = grayToDecimal(c[9:17]) - 1 #pesticide_days
-            x4 = grayToDecimal(c[17:20]) - 1 #flower_area_type
-            
-            f2 = getLiveability(x1, x2, x3, x4)
+        no_mow_pc, mowing_days, pesticide_days, flower_area_type = decodeGrayCandidates(candidates)
 
-            fitness.append(f2)
-        return fitness
\ No newline at end of file
+        return getLiveabilityBatch(no_mow_pc, mowing_days - 1, pesticide_days - 1, flower_area_type - 1).tolist()
\ No newline at end of file
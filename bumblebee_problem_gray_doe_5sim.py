@@ -1,9 +1,12 @@
 from inspyred.benchmarks import Benchmark
-from utils import grayCode, grayToDecimal, runModel, lhs_generator, getLiveability
+from utils import grayCode, grayToDecimal, lhs_generator, getLiveabilityBatch
+from gray_codec import decodeGrayCandidates
 from custom_bounder import Bounder
 from inspyred.ec import emo
 import numpy as np
-import concurrent.futures as futures
+from simulation_pool import runSimulations
+from multi_fidelity import screenFitness1
+from adaptive_replication import adaptiveReplication
 
 class UrbanPollinator(Benchmark):
     """
@@ -46,66 +49,88 @@ class UrbanPollinator(Benchmark):
 
         return seq
         
+    def decode(self, candidate):
+        '''
+        Returns no_mow_pc, mowing_days, pesticide_days and flower_area_type of the candidate.
+        '''
+        return [
+            candidate[0],
+            grayToDecimal(candidate[1:9]),
+            grayToDecimal(candidate[9:17]),
+            grayToDecimal(candidate[17:20])
+        ]
+
     def evaluator(self, candidates, args):
         generation = args.setdefault('generation', 0)
         seeds = args.setdefault('seed', [23,5557,167,904,8895])
-        max_cores = args.setdefault('max_cores', 8)
+        args.setdefault('max_cores', 8)
         fitness = []
-        f1s = self.getFitness1(candidates, generation, seeds, max_cores)
         f2s = self.getFitness2(candidates)
+        if args.get('adaptive_replication'):
+            f1s, ses, replications = self.getAdaptiveFitness1(candidates, f2s, generation, seeds, args)
+            for i in range(len(candidates)):
+                if f1s[i] is None:
+                    fitness.append(None)
+                    continue
+                fit = emo.Pareto([f1s[i], f2s[i]])
+                # mean and standard error of the hibernated queens over the replications
+                fit.standard_error = ses[i]
+                fit.replications = replications[i]
+                fitness.append(fit)
+            return fitness
+        if args.get('screening_fidelity') is not None:
+            f1s = screenFitness1(self.getFitness1, candidates, f2s, generation, seeds, args)
+        else:
+            f1s = self.getFitness1(candidates, generation, seeds, args)
         for i in range(len(candidates)):
-            fitness.append(emo.Pareto([f1s[i], f2s[i]]))
+            # a candidate whose simulations failed is excluded by the evolution
+            fitness.append(emo.Pareto([f1s[i], f2s[i]]) if f1s[i] is not None else None)
 
         return fitness
     
-    def getFitness1(self, candidates, generation, seeds, max_cores=8):
+    def getFitness1(self, candidates, generation, seeds, args=None):
         fitness = []
 
-        # Multiprocessing
-        proc_res = []
+        params = []
+        for c in candidates:
+            params.append({
+                "no_mow_pc": c[0],
+                "mowing_days": grayToDecimal(c[1:9]),
+                "pesticide_days": grayToDecimal(c[9:17]),
+                "flower_area_type": grayToDecimal(c[17:20])
+            })
+        # seeds interleaved across the candidates, so that the replications
+        # of a slow candidate don't end up all at the end of the queue
+        jobs = [{**p, "seed": seed} for seed in seeds for p in params]
 
-        with futures.ProcessPoolExecutor(max_workers=max_cores) as executor:
-            for c in candidates:
-                args = {
-                    "no_mow_pc": c[0],
-                    "mowing_days": grayToDecimal(c[1:9]),
-                    "pesticide_days": grayToDecimal(c[9:17]),
-                    "flower_area_type": grayToDecimal(c[17:20])
-                }
-                temp = []
-                for seed in seeds:
-                    args["seed"] = seed
-                    temp.append(
-                        executor.submit(
-                            runModel, args, generation
-                        )
-                    )
-                proc_res.append(temp)
+        # Multiprocessing on the shared pool of the run
+        results = runSimulations(jobs, generation, args)
 
         for i in range(len(candidates)):
-            temp = []
-            for j in range(len(seeds)):
-                try:
-                    qty = proc_res[i][j].result()
-                    temp.append(qty)
-                    print(f"Process {i}_{j} terminated correctly")
-                except Exception as ex:
-                    print(f"Error in process {i}_{j}: [{ex}]")
-                    temp.append(0)
-            
-            fitness.append(np.mean(temp))
+            # mean of the simulations that didn't fail
+            temp = [r for r in results[i::len(candidates)] if r is not None]
+            fitness.append(np.mean(temp) if len(temp) > 0 else None)
             
         return fitness
     
+    def getAdaptiveFitness1(self, candidates, f2s, generation, seeds, args):
+        '''
+        Like getFitness1, but the candidates are simulated only with the seeds
+        needed to decide their dominance (see adaptive_replication.py).
+        Returns means, standard errors and number of replications.
+        '''
+        def makeJob(i, seed):
+            return {
+                "no_mow_pc": candidates[i][0],
+                "mowing_days": grayToDecimal(candidates[i][1:9]),
+                "pesticide_days": grayToDecimal(candidates[i][9:17]),
+                "flower_area_type": grayToDecimal(candidates[i][17:20]),
+                "seed": seed
+            }
+
+        return adaptiveReplication(makeJob, len(candidates), f2s, seeds, generation, args)
+
     def getFitness2(self, candidates):
-        fitness = []
-        for c in candidates:
-            x1 = c[0] #no_mow_pc
-            x2 = grayToDecimal(c[1:9]) - 1 #mowing_days
-            x3 = grayToDecimal(c[9:17]) - 1 #pesticide_days
-            x4 = grayToDecimal(c[17:20]) - 1 #flower_area_type
-            
-            f2 = getLiveability(x1, x2, x3, x4)
+        no_mow_pc, mowing_days, pesticide_days, flower_area_type = decodeGrayCandidates(candidates)
 
-            fitness.append(f2)
-        return fitness
\ No newline at end of file
+        return getLiveabilityBatch(no_mow_pc, mowing_days - 1, pesticide_days - 1, flower_area_type - 1).tolist()
\ No newline at end of file
@@ -1,9 +1,9 @@
 from inspyred.benchmarks import Benchmark
-from utils import runModel
 from custom_bounder import Bounder
 from inspyred.ec import emo
-import concurrent.futures as futures
-from utils import getLiveability, lhs_generator
+from simulation_pool import runSimulations
+from multi_fidelity import screenFitness1
+from utils import getLiveabilityBatch, lhs_generator
 
 class UrbanPollinator(Benchmark):
     """
@@ -47,59 +47,46 @@ class UrbanPollinator(Benchmark):
         ]
         return seq
         
+    def decode(self, candidate):
+        '''
+        Returns no_mow_pc, mowing_days, pesticide_days and flower_area_type of the candidate.
+        '''
+        return [candidate[0], candidate[1], candidate[2], candidate[3]]
+
     def evaluator(self, candidates, args):
         generation = args.setdefault('generation', 0)
         seed = args.setdefault('seed', 23)
-        max_cores = args.setdefault('max_cores', 8)
+        args.setdefault('max_cores', 8)
         fitness = []
-        f1s = self.getFitness1(candidates, generation, seed, max_cores)
         f2s = self.getFitness2(candidates)
+        if args.get('screening_fidelity') is not None:
+            f1s = screenFitness1(self.getFitness1, candidates, f2s, generation, seed, args)
+        else:
+            f1s = self.getFitness1(candidates, generation, seed, args)
         for i in range(len(candidates)):
-            fitness.append(emo.Pareto([f1s[i], f2s[i]]))
+            # a candidate whose simulations failed is excluded by the evolution
+            fitness.append(emo.Pareto([f1s[i], f2s[i]]) if f1s[i] is not None else None)
 
         return fitness
     
-    def getFitness1(self, candidates, generation, seed, max_cores=8):
-        fitness = []
-
-        # Multiprocessing
-        proc_res = []
-
-        with futures.ProcessPoolExecutor(max_workers=max_cores) as executor:
-            for c in candidates:
-                args = {
-                    "no_mow_pc": c[0],
-                    "mowing_days": c[1],
-                    "pesticide_days": c[2],
-                    "flower_area_type": c[3],
-                    "seed": seed
-                }
-                proc_res.append(
-                    executor.submit(
-                        runModel, args, generation
-                    )
-                )
-
-        for i in range(len(proc_res)):
-            try:
-                qty = proc_res[i].result()
-                fitness.append(qty)
-                print(f"Process {i} terminated correctly")
-            except Exception as ex:
-                print(f"Error in process {i}: [{ex}]")
+    def getFitness1(self, candidates, generation, seed, args=None):
+        jobs = []
+        for c in candidates:
+            jobs.append({
+                "no_mow_pc": c[0],
+                "mowing_days": c[1],
+                "pesticide_days": c[2],
+                "flower_area_type": c[3],
+                "seed": seed
+            })
 
-            
-        return fitness
+        # Multiprocessing on the shared pool of the run
+        return runSimulations(jobs, generation, args)
     
     def getFitness2(self, candidates):
-        fitness = []
-        for c in candidates:
-            x1 = c[0] #no_mow_pc
-            x2 = c[1] - 1 #mowing_days
-            x3 = c[2] - 1 #pesticide_days
-            x4 = c[3] - 1 #flower_area_type
-            
-            f2 = getLiveability(x1, x2, x3, x4)
+        x1 = [c[0] for c in candidates] #no_mow_pc
+        x2 = [c[1] - 1 for c in candidates] #mowing_days
+        x3 = [c[2] - 1 for c in candidates] #pesticide_days
+        x4 = [c[3] - 1 for c in candidates] #flower_area_type
 
-            fitness.append(f2)
-        return fitness
\ No newline at end of file
+        return getLiveabilityBatch(x1, x2, x3, x4).tolist()
\ No newline at end of file
@@ -0,0 +1,66 @@
+import os
+import pickle
+
+def saveCheckpoint(ec, filename):
+    '''
+    Saves the state of the evolutionary computation needed to resume the run:
+    population, archive, state of the random number generator, counters,
+    the size of the population log and the surrogate history.
+    The file is replaced atomically, so it always holds the latest complete
+    checkpoint even if the process is killed while writing.
+    '''
+    state = {
+        "population": ec.population,
+        "archive": ec.archive,
+        "random_state": ec._random.get_state(),
+        "num_generations": ec.num_generations,
+        "num_evaluations": ec.num_evaluations,
+        "num_preselection_avoided": getattr(ec, "num_preselection_avoided", 0),
+    }
+    population_log = ec._kwargs.get("population_log")
+    if population_log is not None:
+        state["population_log_size"] = population_log.sync()
+    surrogate = ec._kwargs.get("surrogate")
+    if surrogate is not None:
+        state["surrogate_history"] = (surrogate.history_X, surrogate.history_y)
+
+    if os.path.dirname(filename):
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temp_filename = filename + ".tmp"
+    with open(temp_filename, "wb") as f:
+        pickle.dump(state, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_filename, filename)
+
+def checkpointIfDue(ec):
+    '''
+    Saves a checkpoint in args["checkpoint_filename"], if given, every
+    args["checkpoint_interval"] generations (default 1, 0 disables it).
+    '''
+    filename = ec._kwargs.get('checkpoint_filename')
+    interval = ec._kwargs.setdefault('checkpoint_interval', 1)
+    if filename is not None and interval > 0 and ec.num_generations % interval == 0:
+        ec.logger.debug('checkpoint at generation {0} and evaluation {1}'.format(ec.num_generations, ec.num_evaluations))
+        saveCheckpoint(ec, filename)
+
+def loadCheckpoint(filename):
+    with open(filename, "rb") as f:
+        return pickle.load(f)
+
+def restoreCheckpoint(ec, state):
+    '''
+    Restores on the evolutionary computation a state saved by saveCheckpoint.
+    '''
+    ec.population = state["population"]
+    ec.archive = state["archive"]
+    ec._random.set_state(state["random_state"])
+    ec.num_generations = state["num_generations"]
+    ec.num_evaluations = state["num_evaluations"]
+    ec.num_preselection_avoided = state["num_preselection_avoided"]
+    population_log = ec._kwargs.get("population_log")
+    if population_log is not None and "population_log_size" in state:
+        population_log.truncate(state["population_log_size"])
+    surrogate = ec._kwargs.get("surrogate")
+    if surrogate is not None and "surrogate_history" in state:
+        surrogate.history_X, surrogate.history_y = state["surrogate_history"]
@@ -0,0 +1,109 @@
+import numpy as np
+import heapq
+import threading
+import logging
+from utils import getFidelity, FULL_FIDELITY
+
+logger = logging.getLogger('inspyred.ec.cost_model')
+
+def fidelityWork(fidelity=None):
+    '''
+    Work of a simulation at the given fidelity relative to full fidelity:
+    simulated steps times cells of the green area.
+    '''
+    fidelity = getFidelity(fidelity)
+    def work(f):
+        return f["years"] * f["steps_per_day"] * f["size"][0] * f["size"][1]
+    return work(fidelity) / work(FULL_FIDELITY)
+
+def predictMakespan(costs, workers):
+    '''
+    Makespan of running the jobs with the given costs, in the given order,
+    each on the first worker that gets free (list scheduling).
+    '''
+    if len(costs) == 0:
+        return 0
+    loads = [0] * min(workers, len(costs))
+    for cost in costs:
+        heapq.heappush(loads, heapq.heappop(loads) + cost)
+    return max(loads)
+
+class SimulationCostModel(object):
+    """Model of the wall time of a simulation from its parameters.
+
+    The log of the wall time per unit of work (see ``fidelityWork``) is
+    fitted with a ridge regression on the scaled no mow percentage,
+    mowing and pesticide days and the one-hot flower area type. The model
+    is not used until *min_history* simulations are known.
+
+    Public Attributes:
+    - *max_history* -- maximum number of simulations used for fitting
+    - *min_history* -- minimum number of simulations to use the model
+    - *regularization* -- ridge penalty of the regression
+    - *history_X* -- features of the simulations done
+    - *history_y* -- log wall time per unit of work of the simulations done
+    - *observed* -- number of simulations added, also the ones dropped from the history
+
+    """
+    def __init__(self, max_history=5000, min_history=10, regularization=1e-2):
+        self.max_history = max_history
+        self.min_history = min_history
+        self.regularization = regularization
+        self.history_X = []
+        self.history_y = []
+        self.observed = 0
+        self.weights = None
+        # observations at the last fit: the history is capped, so its
+        # length stops changing once it is full
+        self.fitted_at = 0
+        # updated by the evaluation threads of the asynchronous mode
+        self.lock = threading.Lock()
+
+    def features(self, job):
+        flower_area_type = np.zeros(7)
+        flower_area_type[int(job["flower_area_type"]) - 1] = 1
+        return np.concatenate(([job["no_mow_pc"], job["mowing_days"] / 190, job["pesticide_days"] / 190], flower_area_type))
+
+    def update(self, job, wall_time):
+        '''
+        Adds the wall time of a simulation (runModel arguments) to the history.
+        '''
+        if wall_time is None or wall_time <= 0:
+            return
+        with self.lock:
+            self.history_X.append(self.features(job))
+            self.history_y.append(np.log(wall_time / fidelityWork(job.get("fidelity"))))
+            self.observed += 1
+            if len(self.history_y) > self.max_history:
+                del self.history_X[0]
+                del self.history_y[0]
+
+    def load(self, store):
+        '''
+        Adds the successful simulations recorded in an EvaluationStore.
+        '''
+        for job, wall_time in store.timings(self.max_history):
+            self.update(job, wall_time)
+        logger.info('cost model loaded with {0} simulations'.format(len(self.history_y)))
+
+    def fit(self):
+        with self.lock:
+            if len(self.history_y) < self.min_history:
+                return None
+            if self.weights is None or self.fitted_at != self.observed:
+                X = np.array(self.history_X)
+                y = np.array(self.history_y)
+                self.y_mean = y.mean()
+                A = X.T.dot(X) + self.regularization * np.eye(X.shape[1])
+                self.weights = np.linalg.solve(A, X.T.dot(y - self.y_mean))
+                self.fitted_at = self.observed
+            return self.weights
+
+    def predict(self, jobs):
+        '''
+        Predicted wall times (seconds) of the jobs, None until the model has
+        enough simulations.
+        '''
+        if self.fit() is None:
+            return None
+        return [float(np.exp(self.y_mean + self.features(job).dot(self.weights))) * fidelityWork(job.get("fidelity")) for job in jobs]
@@ -1,5 +1,8 @@
 from utils import grayToDecimal, grayCode
+from gray_codec import decodeGrayArray, encodeGrayArray
+from contextlib import contextmanager
 import copy
+import numpy as np
 from typing import List
 from math import floor
 
@@ -40,6 +43,9 @@ class Bounder(object):
         
     This function should return the resulting candidate after 
     bounding has been performed.
+
+    A whole population can be bounded at once with ``bound``, which
+    clamps each group of alleles of all the candidates with NumPy.
     
     Public Attributes:
     - *alleles_list* -- list of alleles
@@ -82,4 +88,86 @@ class Bounder(object):
                     bounded_candidate[alleles] = max(min(candidate[alleles], self.bounds_list[i][1]), self.bounds_list[i][0])
 
             return bounded_candidate
-        
+
+    def bound(self, candidates, args=None):
+        '''
+        Returns the candidates bounded as by calling the bounder on each of
+        them, but clamping each group of alleles of all the candidates at
+        once. The candidates are not modified.
+        '''
+        if self.alleles_list is None or self.bounds_list is None or self.allele_types is None or len(candidates) == 0:
+            return candidates
+        return toCandidates(self.boundArray(np.array(candidates, dtype=float)), self.integerAlleles(len(candidates[0])))
+
+    def boundArray(self, population):
+        '''
+        Bounds a population stored as a float array with one row per
+        candidate and returns the bounded copy.
+        '''
+        population = np.array(population, dtype=float)
+        if self.alleles_list is None or self.bounds_list is None or self.allele_types is None or len(population) == 0:
+            return population
+
+        for i, alleles in enumerate(self.alleles_list):
+            lower, upper = self.bounds_list[i]
+            if self.allele_types[i] == 'value_coded':
+                population[:, alleles] = np.clip(population[:, alleles], lower, upper)
+            elif self.allele_types[i] == 'value_coded_discrete':
+                population[:, alleles] = np.clip(np.floor(population[:, alleles]), lower, upper)
+            else:
+                width = alleles[1] - alleles[0]
+                bits = population[:, alleles[0]:alleles[1]].astype(np.uint8)
+                if self.allele_types[i] == 'gray_code':
+                    bits = encodeGrayArray(np.clip(decodeGrayArray(bits), lower, upper), width)
+                elif self.allele_types[i] == 'bynary_code':
+                    dec = bits.dot(1 << np.arange(width - 1, -1, -1, dtype=np.int64))
+                    # the binary code keeps its width
+                    bits = ((np.clip(dec, lower, upper)[:, np.newaxis] >> np.arange(width - 1, -1, -1)) & 1)
+                population[:, alleles[0]:alleles[1]] = bits
+
+        return population
+
+    def integerAlleles(self, num_alleles):
+        '''
+        Boolean mask of the alleles holding integers (discrete values and
+        bits) in candidates of *num_alleles* alleles.
+        '''
+        integers = np.zeros(num_alleles, dtype=bool)
+        for i, alleles in enumerate(self.alleles_list or []):
+            if self.allele_types[i] == 'value_coded_discrete':
+                integers[alleles] = True
+            elif self.allele_types[i] != 'value_coded':
+                integers[alleles[0]:alleles[1]] = True
+        return integers
+
+def toCandidates(population, integers):
+    '''
+    Converts a float array of candidates back to lists, with int values in
+    the alleles of the boolean mask *integers*.
+    '''
+    candidates = population.astype(object)
+    candidates[:, integers] = population[:, integers].astype(np.int64).astype(object)
+    return candidates.tolist()
+
+def unbounded(candidate, args):
+    return candidate
+
+@contextmanager
+def deferredBounding(ec):
+    '''
+    Context of the variation of a generation: if ec._kwargs["bound_once"]
+    is True and the bounder of ec can bound a population (see
+    Bounder.bound), the variators don't bound the children of every
+    operator (ec.bounder is ``unbounded`` within the context) and the
+    yielded function bounds all the offspring at the end of the variation
+    pipeline; otherwise it returns the offspring unchanged.
+    '''
+    bounder = ec.bounder
+    if not ec._kwargs.get('bound_once', False) or not hasattr(bounder, 'bound'):
+        yield lambda candidates: candidates
+        return
+    ec.bounder = unbounded
+    try:
+        yield lambda candidates: bounder.bound(candidates, ec._kwargs)
+    finally:
+        ec.bounder = bounder
@@ -0,0 +1,281 @@
+from inspyred.ec import *
+import collections
+import concurrent.futures as futures
+import copy
+import threading
+from custom_bounder import deferredBounding
+from custom_evolve import parentCandidates
+from simulation_pool import SimulationsCancelled
+
+def dominates(a, b):
+    '''
+    True if the individual a dominates the individual b.
+    '''
+    return b < a
+
+def insertIntoFronts(fronts, individual):
+    '''
+    Inserts the individual in the non-dominated fronts (list of lists of
+    individuals, the best front first) with the efficient non-dominated
+    level update: only the fronts from the level of the new individual
+    downwards are touched, and only the individuals dominated by the ones
+    entering a front are moved to the next one.
+    '''
+    level = len(fronts)
+    for k, front in enumerate(fronts):
+        if not any(dominates(other, individual) for other in front):
+            level = k
+            break
+
+    moved = [individual]
+    while len(moved) > 0 and level < len(fronts):
+        staying = []
+        dominated = []
+        for other in fronts[level]:
+            if any(dominates(m, other) for m in moved):
+                dominated.append(other)
+            else:
+                staying.append(other)
+        fronts[level] = staying + moved
+        moved = dominated
+        level += 1
+    if len(moved) > 0:
+        fronts.append(moved)
+    return fronts
+
+def crowdingDistance(individuals):
+    '''
+    Crowding distance of the individuals of a front, computed as in
+    inspyred's nsga_replacement (the extremes of each objective get inf).
+    '''
+    distance = [0 for _ in individuals]
+    num_objectives = len(individuals[0].fitness)
+    for obj in range(num_objectives):
+        order = sorted(range(len(individuals)), key=lambda i: individuals[i].fitness[obj])
+        distance[order[0]] = float('inf')
+        distance[order[-1]] = float('inf')
+        for j in range(1, len(order)-1):
+            distance[order[j]] += individuals[order[j+1]].fitness[obj] - individuals[order[j-1]].fitness[obj]
+    return distance
+
+def removeWorst(fronts):
+    '''
+    Removes from the last front the individual with the lowest crowding
+    distance (the first one in case of ties) and returns it.
+    '''
+    last = fronts[-1]
+    distance = crowdingDistance(last)
+    worst = min(range(len(last)), key=lambda i: distance[i])
+    removed = last.pop(worst)
+    if len(last) == 0:
+        fronts.pop()
+    return removed
+
+class CustomAsyncEvolutionaryComputation(EvolutionaryComputation):
+    def __init__(self, random):
+        super().__init__(random)
+
+    def evolve(self, generator, evaluator, pop_size=100, seeds=None, maximize=True, bounder=None, **args):
+        """Perform the asynchronous (steady state) evolution.
+
+        The initial population is created and evaluated as in
+        ``CustomEvolutionaryComputation.evolve``. Then, instead of waiting for
+        a whole generation of offspring, up to *async_window* offspring are
+        kept under evaluation: as soon as the oldest one is evaluated it is
+        inserted in the population with an incremental non-dominated sorting
+        (the worst individual by rank and crowding distance is removed) and
+        a new offspring is bred and submitted. Results are integrated in
+        submission order, so the run is reproducible for a fixed seed and
+        window, while the simulation pool always has queued work.
+
+        Every *pop_size* integrated offspring count as a generation:
+        migration, archival, observation and the termination test happen
+        at generation boundaries.
+
+        Arguments:
+
+        - *generator* -- the function to be used to generate candidate solutions
+        - *evaluator* -- the function to be used to evaluate candidate solutions
+        - *pop_size* -- the number of Individuals in the population (default 100)
+        - *seeds* -- an iterable collection of candidate solutions to include
+          in the initial population (default None)
+        - *maximize* -- Boolean value stating use of maximization (default True)
+        - *bounder* -- a function used to bound candidate solutions (default None)
+        - *args* -- a dictionary of keyword arguments
+
+        Optional keyword arguments in args:
+
+        - *async_window* -- the number of offspring under evaluation at the
+          same time (default twice *max_cores*)
+
+        The offspring preselection, *bound_once* and the population given to
+        the operators work as in ``CustomEvolutionaryComputation``.
+
+        """
+        self._kwargs = args
+        if isinstance(self.variator, collections.Iterable):
+            if self._kwargs['variations_args'] is None:
+                self._kwargs['variations_args'] = []
+                for i in range(len(self.variator)):
+                    self._kwargs['variations_args'].append({})
+            elif len(self._kwargs['variations_args']) != len(self.variator):
+                raise ValueError('The number of variation arguments must match the number of variations.')
+
+        self._kwargs['_ec'] = self
+        window = self._kwargs.setdefault('async_window', 2 * self._kwargs.get('max_cores', 1))
+
+        if seeds is None:
+            seeds = []
+        if bounder is None:
+            bounder = Bounder()
+
+        self.termination_cause = None
+        self.generator = generator
+        self.evaluator = evaluator
+        self.bounder = bounder
+        self.maximize = maximize
+        self.population = []
+        self.archive = []
+        self.fronts = []
+
+        # Create the initial population.
+        if not isinstance(seeds, collections.Sequence):
+            seeds = [seeds]
+        initial_cs = copy.copy(seeds)
+        num_generated = max(pop_size - len(seeds), 0)
+        i = 0
+        self.logger.debug('generating initial population')
+        while i < num_generated:
+            cs = generator(random=self._random, args=self._kwargs)
+            initial_cs.append(cs)
+            i += 1
+        self.logger.debug('evaluating initial population')
+        initial_fit = evaluator(candidates=initial_cs, args={**self._kwargs, "generation":-1})
+
+        for cs, fit in zip(initial_cs, initial_fit):
+            if fit is not None:
+                ind = Individual(cs, maximize=maximize)
+                ind.fitness = fit
+                self.population.append(ind)
+                insertIntoFronts(self.fronts, ind)
+            else:
+                self.logger.warning('excluding candidate {0} because fitness received as None'.format(cs))
+        self.logger.debug('population size is now {0}'.format(len(self.population)))
+
+        self.num_evaluations = len(initial_fit)
+        self.num_generations = 0
+        self.num_preselection_avoided = 0
+
+        self.logger.debug('archiving initial population')
+        self.archive = self.archiver(random=self._random, population=self.population, archive=list(self.archive), args=self._kwargs)
+        self.logger.debug('archive size is now {0}'.format(len(self.archive)))
+        self.logger.debug('population size is now {0}'.format(len(self.population)))
+        self._observe()
+
+        in_flight = collections.deque()
+        pending = []
+        integrated = 0
+        # stops the evaluations still under way at termination (see simulation_pool.runJobs)
+        cancel = threading.Event()
+        with futures.ThreadPoolExecutor(max_workers=window) as dispatcher:
+            terminate = self._should_terminate(self.population, self.num_generations, self.num_evaluations)
+            while not terminate:
+                # Keep the window full of offspring under evaluation.
+                while len(in_flight) < window:
+                    if len(pending) == 0:
+                        pending = self._breed()
+                    cs = pending.pop(0)
+                    in_flight.append((cs, dispatcher.submit(evaluator, candidates=[cs], args={**self._kwargs, "generation": self.num_generations, "cancel_event": cancel})))
+
+                # Integrate the oldest offspring.
+                cs, future = in_flight.popleft()
+                fit = future.result()[0]
+                self.num_evaluations += 1
+                integrated += 1
+                if fit is not None:
+                    off = Individual(cs, maximize=maximize)
+                    off.fitness = fit
+                    insertIntoFronts(self.fronts, off)
+                    if sum(len(front) for front in self.fronts) > pop_size:
+                        removeWorst(self.fronts)
+                else:
+                    self.logger.warning('excluding candidate {0} because fitness received as None'.format(cs))
+                self.population = [ind for front in self.fronts for ind in front]
+
+                if integrated == pop_size:
+                    integrated = 0
+                    self._endGeneration()
+                    terminate = self._should_terminate(self.population, self.num_generations, self.num_evaluations)
+
+            self.logger.debug('discarding {0} offspring still under evaluation'.format(len(in_flight)))
+            cancel.set()
+            for cs, future in in_flight:
+                future.cancel()
+        # the dispatcher has waited for the evaluations of the discarded offspring
+        for cs, future in in_flight:
+            if future.cancelled():
+                continue
+            error = future.exception()
+            if isinstance(error, SimulationsCancelled):
+                self.logger.debug('evaluation of discarded candidate {0} cancelled'.format(cs))
+            elif error is not None:
+                self.logger.warning('evaluation of discarded candidate {0} failed: {1!r}'.format(cs, error))
+        return self.population
+
+    def _breed(self):
+        '''
+        Selects two parents (or preselection_factor pairs) and returns their
+        offspring after the variators and the preselection.
+        '''
+        preselection_factor = self._kwargs.setdefault('preselection_factor', 1) if self._kwargs.get('preselector') is not None else 1
+        self.logger.debug('selection using {0} at generation {1} and evaluation {2}'.format(self.selector.__name__, self.num_generations, self.num_evaluations))
+        parents = self.selector(random=self._random, population=self.population, args={**self._kwargs, "num_selected": 2 * preselection_factor})
+        offspring_cs = parentCandidates(self.variator, parents)
+
+        # the offspring are bounded by every operator or, with bound_once, at the end
+        with deferredBounding(self) as boundOffspring:
+            if isinstance(self.variator, collections.Iterable):
+                i = 0
+                for op in self.variator:
+                    self.logger.debug('variation using {0} at generation {1} and evaluation {2}'.format(op.__name__, self.num_generations, self.num_evaluations))
+                    new_args = {**self._kwargs, **self._kwargs['variations_args'][i]}
+                    offspring_cs = op(random=self._random, candidates=offspring_cs, args=new_args)
+                    i += 1
+            else:
+                self.logger.debug('variation using {0} at generation {1} and evaluation {2}'.format(self.variator.__name__, self.num_generations, self.num_evaluations))
+                offspring_cs = self.variator(random=self._random, candidates=offspring_cs, args=self._kwargs)
+            offspring_cs = boundOffspring(offspring_cs)
+
+        if self._kwargs.get('preselector') is not None:
+            pool_size = len(offspring_cs)
+            offspring_cs = self._kwargs['preselector'](offspring_cs, self.population, {**self._kwargs, "num_offspring": pool_size // preselection_factor, "min_offspring": 1})
+            self.num_preselection_avoided += pool_size - len(offspring_cs)
+        return offspring_cs
+
+    def _endGeneration(self):
+        # Migrate individuals.
+        self.logger.debug('migration using {0} at generation {1} and evaluation {2}'.format(self.migrator.__name__, self.num_generations, self.num_evaluations))
+        migrated = self.migrator(random=self._random, population=list(self.population), args=self._kwargs)
+        if [id(ind) for ind in migrated] != [id(ind) for ind in self.population]:
+            self.fronts = []
+            for ind in migrated:
+                insertIntoFronts(self.fronts, ind)
+            self.population = [ind for front in self.fronts for ind in front]
+        self.logger.debug('population size is now {0}'.format(len(self.population)))
+
+        # Archive individuals.
+        self.logger.debug('archival using {0} at generation {1} and evaluation {2}'.format(self.archiver.__name__, self.num_generations, self.num_evaluations))
+        self.archive = self.archiver(random=self._random, archive=self.archive, population=self.population, args=self._kwargs)
+        self.logger.debug('archive size is now {0}'.format(len(self.archive)))
+
+        self.num_generations += 1
+        self._observe()
+
+    def _observe(self):
+        if isinstance(self.observer, collections.Iterable):
+            for obs in self.observer:
+                self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(obs.__name__, self.num_generations, self.num_evaluations))
+                obs(population=list(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
+        else:
+            self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(self.observer.__name__, self.num_generations, self.num_evaluations))
+            self.observer(population=list(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
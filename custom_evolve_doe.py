@@ -1,6 +1,11 @@
 from inspyred.ec import *
 import collections
 import copy
+from custom_bounder import deferredBounding
+from custom_evolve import parentCandidates, observedPopulation
+from checkpoint import checkpointIfDue, restoreCheckpoint
+from multi_fidelity import promoteSurvivors
+from population_arrays import PopulationArrays
 
 class CustomDoeEvolutionaryComputation(EvolutionaryComputation):
     def __init__(self, random):
@@ -34,6 +39,32 @@ class CustomDoeEvolutionaryComputation(EvolutionaryComputation):
         keyword argument:
         
         - *_ec* -- the evolutionary computation (this object)
+
+        If *preselector* is in *args* (for instance ``liveabilityPreselection``
+        or ``surrogateInfill``), *preselection_factor* times more offspring
+        are bred and only the ones returned by
+        ``preselector(candidates, population, args)`` are evaluated; the
+        number of offspring not evaluated is counted in the
+        *num_preselection_avoided* attribute.
+
+        If *bound_once* is True in *args*, the offspring are bounded once at
+        the end of the variation with ``Bounder.bound`` instead of by every
+        variator (see ``custom_bounder.deferredBounding``).
+
+        The terminator, the selector and the archiver get the population
+        itself instead of a copy, so they must not modify it (the inspyred
+        ones don't); every observer gets its own copy.
+
+        If *compact_population* is True in *args*, the population is kept
+        between the generations as a ``population_arrays.PopulationArrays``,
+        as in ``custom_evolve.CustomEvolutionaryComputation.evolve``. The
+        final population is returned as a list of Individuals anyway.
+
+        If *checkpoint_filename* is in *args*, the state of the run is saved
+        there every *checkpoint_interval* generations (default 1); a state
+        loaded with ``checkpoint.loadCheckpoint`` and passed as
+        *resume_checkpoint* resumes the run from it, with the same results
+        of an uninterrupted run.
         
         """
         self._kwargs = args
@@ -46,6 +77,9 @@ class CustomDoeEvolutionaryComputation(EvolutionaryComputation):
                 raise ValueError('The number of variation arguments must match the number of variations.')
 
         self._kwargs['_ec'] = self
+        if self._kwargs.get('screening_fidelity') is not None:
+            # the screened candidates of the last evaluation (see multi_fidelity.promoteSurvivors)
+            self._kwargs['screened_candidates'] = set()
         
         if seeds is None:
             seeds = []
@@ -60,63 +94,91 @@ class CustomDoeEvolutionaryComputation(EvolutionaryComputation):
         self.population = []
         self.archive = []
         
-        # Create the initial population.
-        if not isinstance(seeds, collections.Sequence):
-            seeds = [seeds]
-        initial_cs = copy.copy(seeds)
-        num_generated = max(pop_size - len(seeds), 0)
-        i = 0
-        self.logger.debug('generating initial population')
+        preselection_factor = self._kwargs.setdefault('preselection_factor', 1) if self._kwargs.get('preselector') is not None else 1
+        compact = self._kwargs.setdefault('compact_population', False)
+        checkpoint = self._kwargs.get('resume_checkpoint')
+        if checkpoint is not None:
+            self.logger.debug('resuming from the checkpoint at generation {0} and evaluation {1}'.format(checkpoint['num_generations'], checkpoint['num_evaluations']))
+            restoreCheckpoint(self, checkpoint)
+        else:
+            # Create the initial population.
+            if not isinstance(seeds, collections.Sequence):
+                seeds = [seeds]
+            initial_cs = copy.copy(seeds)
+            num_generated = max(pop_size - len(seeds), 0)
+            i = 0
+            self.logger.debug('generating initial population')
         
-        initial_cs = generator(random=self._random, qty = num_generated, args=self._kwargs)
+            initial_cs = generator(random=self._random, qty = num_generated, args=self._kwargs)
 
-        self.logger.debug('evaluating initial population')
-        initial_fit = evaluator(candidates=initial_cs, args={**self._kwargs, "generation":-1})
+            self.logger.debug('evaluating initial population')
+            initial_fit = evaluator(candidates=initial_cs, args={**self._kwargs, "generation":-1})
         
-        for cs, fit in zip(initial_cs, initial_fit):
-            if fit is not None:
-                ind = Individual(cs, maximize=maximize)
-                ind.fitness = fit
-                self.population.append(ind)
-            else:
-                self.logger.warning('excluding candidate {0} because fitness received as None'.format(cs))
-        self.logger.debug('population size is now {0}'.format(len(self.population)))
+            for cs, fit in zip(initial_cs, initial_fit):
+                if fit is not None:
+                    ind = Individual(cs, maximize=maximize)
+                    ind.fitness = fit
+                    self.population.append(ind)
+                else:
+                    self.logger.warning('excluding candidate {0} because fitness received as None'.format(cs))
+            self.population, promoted_evaluations = promoteSurvivors(self.population, evaluator, -1, self._kwargs)
+            self.logger.debug('population size is now {0}'.format(len(self.population)))
+            if compact:
+                self.population = PopulationArrays.fromIndividuals(self.population)
         
-        self.num_evaluations = len(initial_fit)
-        self.num_generations = 0
+            self.num_evaluations = len(initial_fit) + promoted_evaluations
+            self.num_generations = 0
+            self.num_preselection_avoided = 0
         
-        self.logger.debug('archiving initial population')
-        self.archive = self.archiver(random=self._random, population=list(self.population), archive=list(self.archive), args=self._kwargs)
-        self.logger.debug('archive size is now {0}'.format(len(self.archive)))
-        self.logger.debug('population size is now {0}'.format(len(self.population)))
+            self.logger.debug('archiving initial population')
+            self.archive = self.archiver(random=self._random, population=self.population, archive=list(self.archive), args=self._kwargs)
+            self.logger.debug('archive size is now {0}'.format(len(self.archive)))
+            self.logger.debug('population size is now {0}'.format(len(self.population)))
                 
-        if isinstance(self.observer, collections.Iterable):
-            for obs in self.observer:
-                self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(obs.__name__, self.num_generations, self.num_evaluations))
-                obs(population=list(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
-        else:
-            self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(self.observer.__name__, self.num_generations, self.num_evaluations))
-            self.observer(population=list(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
+            if isinstance(self.observer, collections.Iterable):
+                for obs in self.observer:
+                    self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(obs.__name__, self.num_generations, self.num_evaluations))
+                    obs(population=observedPopulation(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
+            else:
+                self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(self.observer.__name__, self.num_generations, self.num_evaluations))
+                self.observer(population=observedPopulation(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
+            checkpointIfDue(self)
         
-        while not self._should_terminate(list(self.population), self.num_generations, self.num_evaluations):
+        while not self._should_terminate(self.population, self.num_generations, self.num_evaluations):
             # Select individuals.
             self.logger.debug('selection using {0} at generation {1} and evaluation {2}'.format(self.selector.__name__, self.num_generations, self.num_evaluations))
-            parents = self.selector(random=self._random, population=list(self.population), args=self._kwargs)
+            if preselection_factor > 1:
+                # oversized pool of offspring for the preselection
+                parents = self.selector(random=self._random, population=self.population, args={**self._kwargs, "num_selected": self._kwargs['num_selected'] * preselection_factor})
+            else:
+                parents = self.selector(random=self._random, population=self.population, args=self._kwargs)
             self.logger.debug('selected {0} candidates'.format(len(parents)))
-            parent_cs = [copy.deepcopy(i.candidate) for i in parents]
+            parent_cs = parentCandidates(self.variator, parents)
             offspring_cs = parent_cs
             
-            if isinstance(self.variator, collections.Iterable):
-                i = 0
-                for op in self.variator:
-                    self.logger.debug('variation using {0} at generation {1} and evaluation {2}'.format(op.__name__, self.num_generations, self.num_evaluations))
-                    new_args = {**copy.copy(self._kwargs), **copy.copy(self._kwargs['variations_args'][i])}
-                    offspring_cs = op(random=self._random, candidates=offspring_cs, args=new_args)
-                    i += 1
-            else:
-                self.logger.debug('variation using {0} at generation {1} and evaluation {2}'.format(self.variator.__name__, self.num_generations, self.num_evaluations))
-                offspring_cs = self.variator(random=self._random, candidates=offspring_cs, args=self._kwargs)
+            # the offspring are bounded by every operator or, with bound_once, at the end
+            with deferredBounding(self) as boundOffspring:
+                if isinstance(self.variator, collections.Iterable):
+                    i = 0
+                    for op in self.variator:
+                        self.logger.debug('variation using {0} at generation {1} and evaluation {2}'.format(op.__name__, self.num_generations, self.num_evaluations))
+                        new_args = {**self._kwargs, **self._kwargs['variations_args'][i]}
+                        offspring_cs = op(random=self._random, candidates=offspring_cs, args=new_args)
+                        i += 1
+                else:
+                    self.logger.debug('variation using {0} at generation {1} and evaluation {2}'.format(self.variator.__name__, self.num_generations, self.num_evaluations))
+                    offspring_cs = self.variator(random=self._random, candidates=offspring_cs, args=self._kwargs)
+                offspring_cs = boundOffspring(offspring_cs)
             self.logger.debug('created {0} offspring'.format(len(offspring_cs)))
+
+            # Preselect offspring.
+            if self._kwargs.get('preselector') is not None:
+                pool_size = len(offspring_cs)
+                # the individuals of a compact population are built once
+                population = list(self.population) if compact else self.population
+                offspring_cs = self._kwargs['preselector'](offspring_cs, population, {**self._kwargs, "num_offspring": pool_size // preselection_factor})
+                self.num_preselection_avoided += pool_size - len(offspring_cs)
+                self.logger.debug('preselected {0} of {1} offspring ({2} evaluations avoided so far)'.format(len(offspring_cs), pool_size, self.num_preselection_avoided))
             
             # Evaluate offspring.
             self.logger.debug('evaluation using {0} at generation {1} and evaluation {2}'.format(evaluator.__name__, self.num_generations, self.num_evaluations))
@@ -134,16 +196,20 @@ class CustomDoeEvolutionaryComputation(EvolutionaryComputation):
             # Replace individuals.
             self.logger.debug('replacement using {0} at generation {1} and evaluation {2}'.format(self.replacer.__name__, self.num_generations, self.num_evaluations))
             self.population = self.replacer(random=self._random, population=self.population, parents=parents, offspring=offspring, args=self._kwargs)
+            self.population, promoted_evaluations = promoteSurvivors(self.population, evaluator, self.num_generations, self._kwargs)
+            self.num_evaluations += promoted_evaluations
             self.logger.debug('population size is now {0}'.format(len(self.population)))
             
             # Migrate individuals.
             self.logger.debug('migration using {0} at generation {1} and evaluation {2}'.format(self.migrator.__name__, self.num_generations, self.num_evaluations))
             self.population = self.migrator(random=self._random, population=self.population, args=self._kwargs)
             self.logger.debug('population size is now {0}'.format(len(self.population)))
+            if compact:
+                self.population = PopulationArrays.fromIndividuals(self.population)
             
             # Archive individuals.
             self.logger.debug('archival using {0} at generation {1} and evaluation {2}'.format(self.archiver.__name__, self.num_generations, self.num_evaluations))
-            self.archive = self.archiver(random=self._random, archive=self.archive, population=list(self.population), args=self._kwargs)
+            self.archive = self.archiver(random=self._random, archive=self.archive, population=self.population, args=self._kwargs)
             self.logger.debug('archive size is now {0}'.format(len(self.archive)))
             self.logger.debug('population size is now {0}'.format(len(self.population)))
             
@@ -151,8 +217,9 @@ class CustomDoeEvolutionaryComputation(EvolutionaryComputation):
             if isinstance(self.observer, collections.Iterable):
                 for obs in self.observer:
                     self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(obs.__name__, self.num_generations, self.num_evaluations))
-                    obs(population=list(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
+                    obs(population=observedPopulation(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
             else:
                 self.logger.debug('observation using {0} at generation {1} and evaluation {2}'.format(self.observer.__name__, self.num_generations, self.num_evaluations))
-                self.observer(population=list(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
-        return self.population
\ No newline at end of file
+                self.observer(population=observedPopulation(self.population), num_generations=self.num_generations, num_evaluations=self.num_evaluations, args=self._kwargs)
+            checkpointIfDue(self)
+        return list(self.population) if compact else self.population
\ No newline at end of file
@@ -1,6 +1,8 @@
 import inspyred.ec as ec
 from custom_evolve import CustomEvolutionaryComputation
 from custom_evolve_doe import CustomDoeEvolutionaryComputation
+from custom_evolve_async import CustomAsyncEvolutionaryComputation
+from surrogate import HibernatedQueensSurrogate, surrogateInfill
 
 class CustomNSGA2(ec.emo.NSGA2):
     def __init__(self, random):
@@ -18,4 +20,26 @@ class CustomDoeNSGA2(ec.emo.NSGA2):
     def evolve(self, generator, evaluator, pop_size=100, seeds=None, maximize=True, bounder=None, **args):
         args.setdefault('num_selected', pop_size)
         args.setdefault('tournament_size', 2)
-        return CustomDoeEvolutionaryComputation.evolve(self, generator, evaluator, pop_size, seeds, maximize, bounder, **args)
\ No newline at end of file
+        return CustomDoeEvolutionaryComputation.evolve(self, generator, evaluator, pop_size, seeds, maximize, bounder, **args)
+
+class CustomAsyncNSGA2(CustomAsyncEvolutionaryComputation, ec.emo.NSGA2):
+    def __init__(self, random):
+        super().__init__(random)
+    
+    def evolve(self, generator, evaluator, pop_size=100, seeds=None, maximize=True, bounder=None, **args):
+        args.setdefault('num_selected', pop_size)
+        args.setdefault('tournament_size', 2)
+        return CustomAsyncEvolutionaryComputation.evolve(self, generator, evaluator, pop_size, seeds, maximize, bounder, **args)
+
+class CustomSurrogateNSGA2(ec.emo.NSGA2):
+    def __init__(self, random):
+        super().__init__(random)
+    
+    def evolve(self, generator, evaluator, pop_size=100, seeds=None, maximize=True, bounder=None, **args):
+        args.setdefault('num_selected', pop_size)
+        args.setdefault('tournament_size', 2)
+        args.setdefault('preselection_factor', 4)
+        self.surrogate = HibernatedQueensSurrogate(args['decoder'])
+        args['surrogate'] = self.surrogate
+        args['preselector'] = surrogateInfill
+        return CustomEvolutionaryComputation.evolve(self, generator, self.surrogate.recording(evaluator), pop_size, seeds, maximize, bounder, **args)
@@ -0,0 +1,154 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from utils import getFidelity, getLiveability
+
+class EvaluationStore(object):
+    """Database of every simulation run, with its timing and resources.
+
+    Each call of ``utils.runModel`` is recorded in a SQLite file in WAL mode
+    with the decoded parameters, the seed, the fidelity, the generation,
+    the fitnesses, the wall and CPU time, the peak RSS and the PID of the
+    worker, and the status and exception text if the simulation failed. The records
+    are inserted in batches of *batch_size* (see ``flush``). The same file
+    can be shared by several runs, told apart by *run*.
+
+    Public Attributes:
+    - *filename* -- path of the SQLite file
+    - *run* -- name of the run the records belong to
+    - *batch_size* -- number of records buffered before an insert
+
+    """
+    def __init__(self, filename, run=None, batch_size=100):
+        self.filename = filename
+        self.run = run
+        self.batch_size = batch_size
+        self.buffer = []
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self.connection.execute(
+            '''CREATE TABLE IF NOT EXISTS evaluations (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                run TEXT,
+                timestamp REAL NOT NULL,
+                generation INTEGER NOT NULL,
+                seed INTEGER NOT NULL,
+                no_mow_pc REAL NOT NULL,
+                mowing_days INTEGER NOT NULL,
+                pesticide_days INTEGER NOT NULL,
+                flower_area_type INTEGER NOT NULL,
+                fidelity TEXT NOT NULL,
+                hibernated_queens NUMERIC,
+                liveability REAL NOT NULL,
+                steps INTEGER,
+                wall_time REAL,
+                cpu_time REAL,
+                peak_rss_mb REAL,
+                pid INTEGER,
+                success INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                error TEXT
+            )'''
+        )
+        self.connection.commit()
+
+    def record(self, job, generation, result=None, metrics=None, error=None, status=None):
+        '''
+        Buffers the record of a simulation.
+
+        job: runModel arguments of the simulation
+        generation: current generation
+        result: the SimulationResult, None if the simulation failed
+        metrics: dictionary with "wall_time", "cpu_time", "peak_rss_mb" and
+            "pid" of the simulation, if known
+        error: text of the exception raised by the simulation, if any
+        status: "ok", "error", "timeout" or "crashed" (see
+            simulation_pool.runJobs), by default "ok" if there is a result
+        '''
+        if metrics is None:
+            metrics = {}
+        if status is None:
+            status = "ok" if result is not None else "error"
+        row = (
+            self.run,
+            time.time(),
+            generation,
+            int(job["seed"]),
+            float(job["no_mow_pc"]),
+            int(job["mowing_days"]),
+            int(job["pesticide_days"]),
+            int(job["flower_area_type"]),
+            json.dumps(getFidelity(job.get("fidelity")), sort_keys=True),
+            float(result.hibernated_queens) if result is not None else None,
+            getLiveability(job["no_mow_pc"], job["mowing_days"] - 1, job["pesticide_days"] - 1, job["flower_area_type"] - 1),
+            result.steps if result is not None else None,
+            metrics.get("wall_time"),
+            metrics.get("cpu_time"),
+            metrics.get("peak_rss_mb"),
+            metrics.get("pid"),
+            int(result is not None),
+            status,
+            error
+        )
+        with self.lock:
+            self.buffer.append(row)
+            if len(self.buffer) >= self.batch_size:
+                self._insert()
+
+    def timings(self, limit=None):
+        '''
+        Returns the runModel arguments and the wall time of the latest
+        *limit* (default all) successful simulations, e.g. to train a
+        cost_model.SimulationCostModel.
+        '''
+        self.flush()
+        with self.lock:
+            rows = self.connection.execute(
+                '''SELECT no_mow_pc, mowing_days, pesticide_days, flower_area_type, fidelity, wall_time
+                FROM evaluations WHERE status = 'ok' AND wall_time IS NOT NULL ORDER BY id DESC LIMIT ?''',
+                (limit if limit is not None else -1,)
+            ).fetchall()
+        return [({
+            "no_mow_pc": row[0],
+            "mowing_days": row[1],
+            "pesticide_days": row[2],
+            "flower_area_type": row[3],
+            "fidelity": json.loads(row[4])
+        }, row[5]) for row in reversed(rows)]
+
+    def flush(self):
+        '''
+        Inserts the buffered records.
+        '''
+        with self.lock:
+            self._insert()
+
+    def _insert(self):
+        if len(self.buffer) == 0:
+            return
+        self.connection.executemany(
+            '''INSERT INTO evaluations (run, timestamp, generation, seed, no_mow_pc, mowing_days, pesticide_days,
+            flower_area_type, fidelity, hibernated_queens, liveability, steps, wall_time, cpu_time, peak_rss_mb,
+            pid, success, status, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+            self.buffer
+        )
+        self.connection.commit()
+        self.buffer = []
+
+    def close(self):
+        self.flush()
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
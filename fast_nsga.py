@@ -0,0 +1,183 @@
+import bisect
+import numpy as np
+from population_arrays import PopulationArrays, concatenate
+
+# rows of the population compared at once by the non dominated sorting of
+# more than two objectives
+DOMINANCE_BLOCK = 2 ** 22
+
+def fitnessArrays(individuals):
+    '''
+    Fitness values of the individuals as a float array with one row per
+    individual, and the same values as costs: the fitness values with the
+    sign changed where they are maximized (by the Pareto objects and the
+    maximize of the individuals), so that lower is always better.
+    '''
+    if isinstance(individuals, PopulationArrays):
+        return individuals.fitnessArrays()
+    values = np.array([ind.fitness.values for ind in individuals], dtype=float).reshape(len(individuals), -1)
+    signs = np.array([[-1.0 if m == ind.maximize else 1.0 for m in ind.fitness.maximize] for ind in individuals]).reshape(values.shape)
+    return values, values * signs
+
+def _ranksTwoObjectives(costs):
+    # Jensen's sweep: in lexicographic order a point belongs to the first
+    # front whose last point (the lowest on the second objective) doesn't
+    # dominate it, found by bisection on the last points of the fronts
+    ranks = np.empty(len(costs), dtype=int)
+    first, second = costs[:, 0].tolist(), costs[:, 1].tolist()
+    lasts = []
+    for i in np.lexsort((costs[:, 1], costs[:, 0])).tolist():
+        key = (second[i], first[i])
+        rank = bisect.bisect_left(lasts, key)
+        if rank == len(lasts):
+            lasts.append(key)
+        else:
+            lasts[rank] = key
+        ranks[i] = rank
+    return ranks
+
+def _ranksGeneric(costs):
+    # the fronts are peeled one at a time, comparing blocks of rows with
+    # all the remaining ones; a point is dominated by another one not worse
+    # in any objective and better in one, as for emo.Pareto (NaN is neither)
+    ranks = np.empty(len(costs), dtype=int)
+    remaining = np.arange(len(costs))
+    rank = 0
+    while len(remaining) > 0:
+        others = costs[remaining]
+        block = max(1, DOMINANCE_BLOCK // (len(remaining) * costs.shape[1]))
+        dominated = np.empty(len(remaining), dtype=bool)
+        for start in range(0, len(remaining), block):
+            points = others[start:start + block, np.newaxis, :]
+            worse = (others[np.newaxis, :, :] > points).any(axis=2)
+            better = (others[np.newaxis, :, :] < points).any(axis=2)
+            dominated[start:start + block] = (better & ~worse).any(axis=1)
+        if dominated.all():
+            # NaN costs can make the dominance cyclic: they share the front
+            dominated[:] = False
+        ranks[remaining[~dominated]] = rank
+        remaining = remaining[dominated]
+        rank += 1
+    return ranks
+
+def nondominatedRanks(costs):
+    '''
+    Non dominated front of every row of an array of costs (lower is
+    better), 0 for the non dominated rows: O(N log N) for two objectives,
+    O(N^2) vectorized operations per front otherwise.
+    '''
+    costs = np.asarray(costs, dtype=float)
+    if costs.ndim == 2 and costs.shape[1] == 2 and not np.isnan(costs).any():
+        return _ranksTwoObjectives(costs)
+    return _ranksGeneric(costs)
+
+def crowdingDistance(values):
+    '''
+    Crowding distance of the rows of an array of fitness values of a front,
+    as in inspyred's nsga_replacement: the objectives are not normalized
+    and the extremes of every objective are infinitely distant.
+    '''
+    distance = np.zeros(len(values))
+    order = np.arange(len(values))
+    for obj in range(values.shape[1]):
+        # every objective sorts the order of the previous one, as in inspyred
+        order = order[np.argsort(values[order, obj], kind='stable')]
+        distance[order[[0, -1]]] = np.inf
+        distance[order[1:-1]] += values[order[2:], obj] - values[order[:-2], obj]
+    return distance
+
+def fastNsgaReplacement(random, population, parents, offspring, args):
+    """Replaces population using the NSGA-II non-dominated sorting, with NumPy.
+
+    Drop-in replacement of inspyred's ``replacers.nsga_replacement`` for
+    large populations: the fronts are the same and are filled in the same
+    way, the last one by decreasing crowding distance, and individuals equal
+    to a survivor are skipped. Individuals tied on the crowding distance
+    are taken in the order of the population and the offspring (inspyred
+    takes them in the order of a set of indexes). If the population is a
+    population_arrays.PopulationArrays, so are the survivors.
+
+    .. Arguments:
+       random -- the random number generator object
+       population -- the population of individuals
+       parents -- the list of parent individuals
+       offspring -- the list of offspring individuals
+       args -- a dictionary of keyword arguments
+
+    """
+    if isinstance(population, PopulationArrays):
+        combined = concatenate([population, PopulationArrays.fromIndividuals(offspring)])
+        key = combined.key
+    else:
+        combined = list(population) + list(offspring)
+        key = lambda i: (tuple(combined[i].candidate), tuple(combined[i].fitness.values), combined[i].maximize)
+    if len(combined) == 0:
+        return population
+    values, costs = fitnessArrays(combined)
+    ranks = nondominatedRanks(costs)
+    by_rank = np.argsort(ranks, kind='stable')
+    fronts = np.split(by_rank, np.flatnonzero(np.diff(ranks[by_rank])) + 1)
+
+    survivors = []
+    seen = set()
+    for front in fronts:
+        if len(survivors) + len(front) > len(population):
+            front = front[np.argsort(-crowdingDistance(values[front]), kind='stable')]
+        for i in front.tolist():
+            if len(survivors) == len(population):
+                break
+            k = key(i)
+            if k not in seen:
+                seen.add(k)
+                survivors.append(i)
+        if len(survivors) == len(population):
+            break
+    if isinstance(combined, PopulationArrays):
+        return combined.take(survivors)
+    return [combined[i] for i in survivors]
+
+def fastTournamentSelection(random, population, args):
+    """Return a tournament sampling of individuals from the population, with NumPy.
+
+    Drop-in replacement of inspyred's ``selectors.tournament_selection`` for
+    the NSGA-II: every tournament draws ``tournament_size`` distinct
+    individuals and, as ``max`` on them, the first one wins unless a later
+    one dominates the winner so far. The contenders are in the order they
+    are drawn (inspyred takes them in the order of a set of indexes, which
+    favours some of them among non dominated ones). All the tournaments are
+    drawn at once, so *random* must be a NumpyRandomWrapper. If the
+    population is a population_arrays.PopulationArrays, so are the selected
+    individuals.
+
+    .. Arguments:
+       random -- the random number generator object
+       population -- the population of individuals
+       args -- a dictionary of keyword arguments
+
+    Optional keyword arguments in args:
+
+    - *num_selected* -- the number of individuals to be selected (default 1)
+    - *tournament_size* -- the tournament size (default 2)
+
+    """
+    num_selected = args.setdefault('num_selected', 1)
+    tournament_size = min(args.setdefault('tournament_size', 2), len(population))
+    if num_selected == 0 or tournament_size == 0:
+        return []
+    _, costs = fitnessArrays(population)
+    # the j-th contender is drawn among the individuals not drawn yet
+    contenders = np.empty((num_selected, tournament_size), dtype=int)
+    for j in range(tournament_size):
+        drawn = random.randint(len(population) - j, size=num_selected)
+        for previous in np.sort(contenders[:, :j], axis=1).T:
+            drawn += drawn >= previous
+        contenders[:, j] = drawn
+    winners = contenders[:, 0]
+    for j in range(1, tournament_size):
+        challengers = contenders[:, j]
+        better = (costs[challengers] < costs[winners]).any(axis=1)
+        worse = (costs[challengers] > costs[winners]).any(axis=1)
+        winners = np.where(better & ~worse, challengers, winners)
+    if isinstance(population, PopulationArrays):
+        return population.take(winners)
+    return [population[i] for i in winners.tolist()]
@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import threading
+from utils import getModelParamsHash, fidelityKey
+
+class FitnessCache(object):
+    """Persistent cache of the simulated hibernated queens quantities.
+
+    The results are stored in a SQLite file and they are keyed by the decoded
+    parameters of the candidate, the seed of the simulation and the hash of
+    the model parameters at the fidelity of the simulation (see
+    ``utils.getModelParamsHash``), so the same
+    file can be shared by every run, encoding and seed. The cache can be
+    used by several threads (see ``CustomAsyncNSGA2``).
+
+    Public Attributes:
+    - *filename* -- path of the SQLite file
+    - *params_hash* -- hash of the model parameters at full fidelity
+    - *hits* -- number of lookups found in the cache
+    - *misses* -- number of lookups not found in the cache
+
+    """
+    def __init__(self, filename, params_hash=None):
+        self.filename = filename
+        self.params_hash = params_hash if params_hash is not None else getModelParamsHash()
+        self.fidelity_hashes = {}
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(filename, check_same_thread=False)
+        self.connection.execute(
+            '''CREATE TABLE IF NOT EXISTS fitness (
+                params_hash TEXT NOT NULL,
+                seed INTEGER NOT NULL,
+                no_mow_pc REAL NOT NULL,
+                mowing_days INTEGER NOT NULL,
+                pesticide_days INTEGER NOT NULL,
+                flower_area_type INTEGER NOT NULL,
+                hibernated_queens NUMERIC NOT NULL,
+                PRIMARY KEY (params_hash, seed, no_mow_pc, mowing_days, pesticide_days, flower_area_type)
+            )'''
+        )
+        self.connection.commit()
+
+    def paramsHash(self, fidelity=None):
+        if fidelity is None:
+            return self.params_hash
+        key = fidelityKey(fidelity)
+        if key not in self.fidelity_hashes:
+            self.fidelity_hashes[key] = getModelParamsHash(fidelity)
+        return self.fidelity_hashes[key]
+
+    def key(self, job):
+        return (
+            self.paramsHash(job.get("fidelity")),
+            int(job["seed"]),
+            float(job["no_mow_pc"]),
+            int(job["mowing_days"]),
+            int(job["pesticide_days"]),
+            int(job["flower_area_type"])
+        )
+
+    def get(self, job):
+        '''
+        Returns the cached result of the job (runModel arguments) or None.
+        '''
+        with self.lock:
+            row = self.connection.execute(
+                '''SELECT hibernated_queens FROM fitness WHERE params_hash = ? AND seed = ?
+                AND no_mow_pc = ? AND mowing_days = ? AND pesticide_days = ? AND flower_area_type = ?''',
+                self.key(job)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, job, hibernated_queens):
+        with self.lock:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO fitness VALUES (?, ?, ?, ?, ?, ?, ?)',
+                self.key(job) + (float(hibernated_queens),)
+            )
+            self.connection.commit()
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
@@ -0,0 +1,153 @@
+import numpy as np
+from inspyred.ec import variators
+from custom_variators import single_point_crossover, bit_flip_mutation, gaussian_mutation
+from custom_bounder import toCandidates
+
+class FusedVariator(object):
+    """Variator running a whole pipeline of variators on a NumPy population.
+
+    The pipeline is the list of variators of the algorithm (e.g.
+    ``ga_args["variator"]`` in main.py), with their arguments in
+    args["variations_args"] as for the list itself. Instead of running every
+    variator on every candidate, the population is stored once as a float
+    array with one row per candidate and each operator is applied to all
+    the rows at once, so the offspring have the same distribution of the
+    ones of the list of variators (the random numbers are drawn in another
+    order). The supported variators are ``variators.blend_crossover``,
+    ``single_point_crossover``, ``gaussian_mutation`` and
+    ``bit_flip_mutation``.
+
+    The offspring are bounded after every operator, with
+    ``Bounder.boundArray``, if the bounder of the algorithm is a
+    custom_bounder.Bounder, or once at the end with *bound_once* (see
+    ``custom_bounder.deferredBounding``). The candidates given are never
+    modified, so the evolution doesn't copy them (see
+    custom_evolve.parentCandidates).
+
+    Public Attributes:
+    - *variators* -- the variators of the pipeline
+    - *operators* -- names of the array operators applying them
+
+    """
+    OPERATORS = {
+        variators.blend_crossover: 'blendCrossover',
+        single_point_crossover: 'singlePointCrossover',
+        gaussian_mutation: 'gaussianMutation',
+        bit_flip_mutation: 'bitFlipMutation',
+    }
+
+    preserves_candidates = True
+
+    def __init__(self, variators):
+        unknown = [op.__name__ for op in variators if op not in self.OPERATORS]
+        if len(unknown) > 0:
+            raise ValueError('variators not supported by the fused variation: {0}'.format(', '.join(unknown)))
+        self.__name__ = self.__class__.__name__
+        self.variators = list(variators)
+        self.operators = [self.OPERATORS[op] for op in self.variators]
+
+    def __call__(self, random, candidates, args):
+        variations_args = args.get('variations_args') or [{}] * len(self.operators)
+        if len(variations_args) != len(self.operators):
+            raise ValueError('The number of variation arguments must match the number of variations.')
+        if len(candidates) == 0:
+            return []
+        population = np.array(candidates, dtype=float)
+        bounder = args['_ec'].bounder
+        boundArray = getattr(bounder, 'boundArray', None)
+
+        for operator, op_args in zip(self.operators, variations_args):
+            population = getattr(self, operator)(random, population, {**args, **op_args})
+            if boundArray is not None:
+                population = boundArray(population)
+
+        if hasattr(bounder, 'integerAlleles'):
+            integers = bounder.integerAlleles(population.shape[1])
+        else:
+            integers = self.integerAlleles(candidates, variations_args)
+        return toCandidates(population, integers)
+
+    def integerAlleles(self, candidates, variations_args):
+        '''
+        Alleles that are integers in all the candidates and not changed by
+        a real valued operator.
+        '''
+        integers = np.array([all(isinstance(c[i], (int, np.integer)) for c in candidates) for i in range(len(candidates[0]))])
+        for operator, op_args in zip(self.operators, variations_args):
+            points = op_args.get('blx_points' if operator == 'blendCrossover' else 'g_points')
+            if operator in ('blendCrossover', 'gaussianMutation'):
+                integers[points if points is not None else slice(None)] = False
+        return integers
+
+    def pairs(self, random, population, rate):
+        # the last candidate is discarded if they are odd, as in inspyred
+        population = population[:len(population) // 2 * 2]
+        moms = population[0::2]
+        dads = population[1::2]
+        cross = random.random_sample(len(moms)) < rate
+        return moms, dads, cross
+
+    def blendCrossover(self, random, population, args):
+        alpha = args.get('blx_alpha', 0.1)
+        rate = args.get('crossover_rate', 1.0)
+        points = args.get('blx_points')
+        if points is None:
+            points = list(range(population.shape[1]))
+        moms, dads, cross = self.pairs(random, population, rate)
+        children = np.empty((2 * len(moms), population.shape[1]))
+        # crossed pairs give (copy of dad, copy of mom), the others (mom, dad)
+        children[0::2] = np.where(cross[:, np.newaxis], dads, moms)
+        children[1::2] = np.where(cross[:, np.newaxis], moms, dads)
+        rows = np.nonzero(cross)[0]
+        smallest = np.minimum(moms[np.ix_(rows, points)], dads[np.ix_(rows, points)])
+        largest = np.maximum(moms[np.ix_(rows, points)], dads[np.ix_(rows, points)])
+        delta = alpha * (largest - smallest)
+        for child in (0, 1):
+            u = random.random_sample(smallest.shape)
+            children[np.ix_(2 * rows + child, points)] = smallest - delta + u * (largest - smallest + 2 * delta)
+        return children
+
+    def singlePointCrossover(self, random, population, args):
+        rate = args.get('crossover_rate', 1.0)
+        points = args.get('spx_points')
+        if points is None:
+            points = list(range(population.shape[1]))
+        points = np.asarray(points)
+        moms, dads, cross = self.pairs(random, population, rate)
+        index = points[random.randint(len(points), size=len(moms))]
+        # alleles from the crossover point on are swapped
+        swap = cross[:, np.newaxis] & (points[np.newaxis, :] >= index[:, np.newaxis])
+        bro = np.where(cross[:, np.newaxis], dads, moms)
+        sis = np.where(cross[:, np.newaxis], moms, dads)
+        bro[:, points] = np.where(swap, moms[:, points], bro[:, points])
+        sis[:, points] = np.where(swap, dads[:, points], sis[:, points])
+        children = np.empty((2 * len(moms), population.shape[1]))
+        children[0::2] = bro
+        children[1::2] = sis
+        return children
+
+    def gaussianMutation(self, random, population, args):
+        rate = args.get('mutation_rate', 0.1)
+        mean = args.get('gaussian_mean', 0.0)
+        stdev = args.get('gaussian_stdev', 1.0)
+        points = args.get('g_points')
+        if points is None:
+            points = list(range(population.shape[1]))
+        mutants = population.copy()
+        shape = (len(population), len(points))
+        mutate = random.random_sample(shape) < rate
+        mutants[:, points] += np.where(mutate, random.normal(mean, stdev, shape), 0.0)
+        return mutants
+
+    def bitFlipMutation(self, random, population, args):
+        rate = args.get('mutation_rate', 0.1)
+        points = args.get('bf_points')
+        mutants = population.copy()
+        if points is None:
+            # only the binary alleles of every candidate
+            flip = ((population == 0) | (population == 1)) & (random.random_sample(population.shape) < rate)
+            mutants[flip] = (mutants[flip] + 1) % 2
+        else:
+            flip = random.random_sample((len(population), len(points))) < rate
+            mutants[:, points] = np.where(flip, (population[:, points] + 1) % 2, population[:, points])
+        return mutants
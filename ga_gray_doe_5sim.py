@@ -54,6 +54,11 @@ args["variations_args"] = [
 
 args["max_cores"] = 10
 args["seed"] = [23,5557,167,904,8895]
+# simulate only the seeds needed to decide the dominance of the candidates
+# instead of all of them (see adaptive_replication.py)
+args["adaptive_replication"] = False
+args["initial_replications"] = 2
+args["replication_confidence"] = 1.96
 
 args["fileName_initial_pop"] = 'pop_gray_doe.csv'
     
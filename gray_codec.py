@@ -0,0 +1,100 @@
+import itertools
+import numpy as np
+
+# widths of the gray coded genes: 8 bits for the mowing and pesticide
+# days, 3 bits for the flower area type
+TABLE_WIDTHS = (8, 3)
+# alleles of the gray coded genes in the candidates of the gray problems,
+# the allele 0 is the no mow percentage
+GRAY_GENES = ((1, 9), (9, 17), (17, 20))
+
+def _decodeSlow(bits):
+    n = 0
+    for bit in bits:
+        n = (n << 1) | int(bit)
+    binary = 0
+    # Taking xor until n becomes zero
+    while (n):
+        binary = binary ^ n
+        n = n >> 1
+    return binary
+
+def _encodeSlow(n, width):
+    gray = n ^ (n >> 1)
+    gray_list = list(map(int, bin(gray)[2:]))
+    return [0] * (width - len(gray_list)) + gray_list
+
+# decimal value of every gray code, by the tuple of its bits
+DECODE_TABLES = {width: {bits: _decodeSlow(bits) for bits in itertools.product((0, 1), repeat=width)} for width in TABLE_WIDTHS}
+# bits of the gray code of every decimal value
+ENCODE_TABLES = {width: [tuple(_encodeSlow(n, width)) for n in range(2 ** width)] for width in TABLE_WIDTHS}
+# decimal value of every gray code, by the binary value of its bits
+DECODE_ARRAYS = {width: np.array([_decodeSlow(bits) for bits in itertools.product((0, 1), repeat=width)]) for width in TABLE_WIDTHS}
+
+def decodeGray(bits):
+    '''
+    Decimal value of a gray code given as a sequence of bits, the most
+    significant first.
+    '''
+    table = DECODE_TABLES.get(len(bits))
+    if table is not None:
+        value = table.get(tuple(bits))
+        if value is not None:
+            return value
+    return _decodeSlow(bits)
+
+def encodeGray(n, width):
+    '''
+    Gray code of the decimal value n as a list of *width* bits, the most
+    significant first (more bits if n doesn't fit in *width* bits).
+    '''
+    table = ENCODE_TABLES.get(width)
+    if table is not None and 0 <= n < len(table):
+        return list(table[n])
+    return _encodeSlow(n, width)
+
+def decodeGrayArray(bits):
+    '''
+    Decimal values of the gray codes in the last axis of an array of bits
+    (e.g. uint8, one row per candidate), as an int array with the other axes.
+    '''
+    bits = np.asarray(bits, dtype=np.uint8)
+    width = bits.shape[-1]
+    weights = 1 << np.arange(width - 1, -1, -1, dtype=np.int64)
+    if width in DECODE_ARRAYS:
+        return DECODE_ARRAYS[width][bits.dot(weights)]
+    # the i-th binary bit is the xor of the first i gray bits
+    return np.bitwise_xor.accumulate(bits, axis=-1).dot(weights)
+
+def encodeGrayArray(values, width):
+    '''
+    Gray codes of an array of decimal values as a uint8 array of bits with
+    an extra last axis of length *width*.
+    '''
+    values = np.asarray(values, dtype=np.int64)
+    gray = values ^ (values >> 1)
+    shifts = np.arange(width - 1, -1, -1, dtype=np.int64)
+    return ((gray[..., np.newaxis] >> shifts) & 1).astype(np.uint8)
+
+def genomeArray(candidates):
+    '''
+    Gray coded alleles of the candidates of the gray problems as a uint8
+    array with one row per candidate.
+    '''
+    start, end = GRAY_GENES[0][0], GRAY_GENES[-1][1]
+    return np.array([candidate[start:end] for candidate in candidates], dtype=np.uint8).reshape(len(candidates), end - start)
+
+def decodeGrayCandidates(candidates):
+    '''
+    Decodes the whole population of a gray problem at once: returns the
+    arrays of the no mow percentages, the mowing days, the pesticide days
+    and the flower area types of the candidates, or of the individuals of
+    a population_arrays.PopulationArrays.
+    '''
+    offset = GRAY_GENES[0][0]
+    if hasattr(candidates, 'genes'):
+        genomes, no_mow_pc = candidates.genes, candidates.no_mow_pc
+    else:
+        genomes = genomeArray(candidates)
+        no_mow_pc = np.array([candidate[0] for candidate in candidates], dtype=float)
+    return (no_mow_pc, *(decodeGrayArray(genomes[:, start - offset:end - offset]) for start, end in GRAY_GENES))
@@ -1,9 +1,11 @@
-from pylab import *
+# numpy instead of pylab, so that matplotlib is loaded only to plot
+from numpy import asarray, sum
 
 from inspyred.ec.emo import Pareto
 from numpy.random import RandomState
-import pandas as pd
 from utils import grayToDecimal
+from gray_codec import decodeGrayCandidates
+from population_arrays import PopulationArrays
 
 import functools
 
@@ -33,6 +35,14 @@ class NumpyRandomWrapper(RandomState):
     
 def initial_pop_observer_gray(population, num_generations, num_evaluations, 
                          args):
+    if isinstance(population, PopulationArrays):
+        # the whole population is decoded at once
+        no_mow_pc, mowing_days, pesticide_days, flower_area_type = decodeGrayCandidates(population)
+        rows = [[round(x, 3), m, p, f, fit[0], round(fit[1], 3)] for x, m, p, f, fit in
+                zip(no_mow_pc.tolist(), mowing_days.tolist(), pesticide_days.tolist(), flower_area_type.tolist(), population.fitnessValues())]
+        args["population_log"].append(num_generations, rows, args.get("island", 0))
+        return
+    rows = []
     for guy in population:
         new_guy = []
         new_guy.append(round(guy.candidate[0], 3))
@@ -41,13 +51,18 @@ def initial_pop_observer_gray(population, num_generations, num_evaluations,
         new_guy.append(grayToDecimal(guy.candidate[17:]))
         new_guy.append(guy.fitness[0])
         new_guy.append(round(guy.fitness[1], 3))
-        args["initial_pop_storage"].append(new_guy)
+        rows.append(new_guy)
 
-    df = pd.DataFrame(args["initial_pop_storage"], columns=['no_mow_pc', 'mowing_days', 'pesticide_days', 'flower_area_type', 'fitness_1', 'fitness_2'])
-    df.to_csv(args["fileName_initial_pop"], index=False)
+    args["population_log"].append(num_generations, rows, args.get("island", 0))
 
 def initial_pop_observer_value(population, num_generations, num_evaluations, 
                          args):
+    if isinstance(population, PopulationArrays):
+        rows = [[round(c[0], 3), c[1], c[2], c[3], fit[0], round(fit[1], 3)] for c, fit in
+                zip(population.candidates(), population.fitnessValues())]
+        args["population_log"].append(num_generations, rows, args.get("island", 0))
+        return
+    rows = []
     for guy in population:
         new_guy = []
         new_guy.append(round(guy.candidate[0], 3))
@@ -56,10 +71,9 @@ def initial_pop_observer_value(population, num_generations, num_evaluations,
         new_guy.append(guy.candidate[3])
         new_guy.append(guy.fitness[0])
         new_guy.append(round(guy.fitness[1], 3))
-        args["initial_pop_storage"].append(new_guy)
+        rows.append(new_guy)
 
-    df = pd.DataFrame(args["initial_pop_storage"], columns=['no_mow_pc', 'mowing_days', 'pesticide_days', 'flower_area_type', 'fitness_1', 'fitness_2'])
-    df.to_csv(args["fileName_initial_pop"], index=False)
+    args["population_log"].append(num_generations, rows, args.get("island", 0))
     
         
 def generator(random, args):
@@ -0,0 +1,155 @@
+import concurrent.futures as futures
+import copy
+import logging
+import queue
+import threading
+from inspyred_utils import NumpyRandomWrapper
+
+logger = logging.getLogger('inspyred.ec.island_model')
+
+TOPOLOGIES = ("ring", "complete", "random")
+
+def nonDominated(population):
+    '''
+    Individuals of the population not dominated by any other one.
+    '''
+    # a population_arrays.PopulationArrays builds its individuals when iterated
+    population = list(population)
+    return [ind for ind in population if not any(ind < other for other in population)]
+
+class NonDominatedMigrator(object):
+    """Migrator exchanging non dominated individuals between islands.
+
+    It is the migrator of every island of an ``IslandModel``; the island
+    calling it is told by args["island"]. At the end of every
+    *migration_interval* generations an island sends copies of up to
+    *num_migrants* of its non dominated individuals, chosen at random, to
+    its neighbours in the *topology*:
+
+    - "ring" -- the next island
+    - "complete" -- all the other islands
+    - "random" -- another island chosen at random at every migration
+
+    The migrants are queued in the inbox of the neighbour, which doesn't
+    wait for them: at the end of its next generation it adds the ones
+    arrived to its population and keeps its size with the replacer of the
+    island (the NSGA-II replacement).
+
+    Public Attributes:
+    - *num_islands* -- number of islands
+    - *topology* -- neighbours of the islands, one of TOPOLOGIES
+    - *migration_interval* -- generations between two migrations
+    - *num_migrants* -- maximum number of individuals sent to a neighbour
+    - *inboxes* -- queues of the migrants sent to each island
+    - *migrants* -- number of individuals received by the islands so far
+
+    """
+    def __init__(self, num_islands, topology="ring", migration_interval=5, num_migrants=2):
+        if topology not in TOPOLOGIES:
+            raise ValueError('unknown topology {0}, it must be one of {1}'.format(topology, ', '.join(TOPOLOGIES)))
+        self.__name__ = self.__class__.__name__
+        self.num_islands = num_islands
+        self.topology = topology
+        self.migration_interval = migration_interval
+        self.num_migrants = num_migrants
+        self.inboxes = [queue.Queue() for _ in range(num_islands)]
+        self.migrants = 0
+        self.lock = threading.Lock()
+
+    def neighbours(self, island, random):
+        others = [k for k in range(self.num_islands) if k != island]
+        if len(others) == 0:
+            return []
+        if self.topology == "ring":
+            return [(island + 1) % self.num_islands]
+        if self.topology == "complete":
+            return others
+        return [others[random.randint(len(others))]]
+
+    def __call__(self, random, population, args):
+        island = args["island"]
+        arrived = []
+        while True:
+            try:
+                arrived.extend(self.inboxes[island].get_nowait())
+            except queue.Empty:
+                break
+        if len(arrived) > 0 and len(population) > 0:
+            population = args["_ec"].replacer(random=random, population=population, parents=[], offspring=arrived, args=args)
+            with self.lock:
+                self.migrants += len(arrived)
+            logger.debug('island {0}: {1} migrants received'.format(island, len(arrived)))
+
+        # the generation is counted after the migration
+        generation = args["_ec"].num_generations + 1
+        if self.migration_interval > 0 and generation % self.migration_interval == 0:
+            front = nonDominated(population)
+            emigrants = list(random.sample(front, min(self.num_migrants, len(front))))
+            for neighbour in self.neighbours(island, random):
+                self.inboxes[neighbour].put(copy.deepcopy(emigrants))
+        return population
+
+def _islandsAttribute(name):
+    def getter(self):
+        return getattr(self.islands[0], name)
+    def setter(self, value):
+        for island in self.islands:
+            setattr(island, name, value)
+    return property(getter, setter)
+
+class IslandModel(object):
+    """Island model of an algorithm, with several populations evolving concurrently.
+
+    Island k is an instance of *algorithm* (e.g. custom_nsga2.CustomNSGA2)
+    with its own NumpyRandomWrapper seeded with *seed* + k, and it is
+    evolved in its own thread with *pop_size* individuals. The islands
+    share the arguments of ``evolve``, so one evaluation backend, fitness
+    cache, evaluation store and population log serve all of them: while
+    an island waits for its slowest simulation the others keep the workers
+    busy, and there is no barrier between the generations of different
+    islands. The islands exchange their non dominated individuals through
+    a ``NonDominatedMigrator``.
+
+    The model has the interface of the algorithms used by
+    multi_objective_bumblebee.run_nsga2: the terminator, variator,
+    observer, archiver, selector and replacer are set on every island, and ``evolve`` returns
+    the final populations of all the islands. The islands are not
+    checkpointed.
+
+    Public Attributes:
+    - *islands* -- the algorithms of the islands
+    - *migrator* -- the NonDominatedMigrator of the islands
+
+    """
+    terminator = _islandsAttribute('terminator')
+    variator = _islandsAttribute('variator')
+    observer = _islandsAttribute('observer')
+    archiver = _islandsAttribute('archiver')
+    selector = _islandsAttribute('selector')
+    replacer = _islandsAttribute('replacer')
+
+    def __init__(self, algorithm, seed, num_islands=4, topology="ring", migration_interval=5, num_migrants=2):
+        self.islands = [algorithm(NumpyRandomWrapper(seed + k)) for k in range(num_islands)]
+        self.migrator = NonDominatedMigrator(num_islands, topology, migration_interval, num_migrants)
+        for island in self.islands:
+            island.migrator = self.migrator
+
+    @property
+    def num_evaluations(self):
+        return sum(getattr(island, 'num_evaluations', 0) for island in self.islands)
+
+    @property
+    def num_preselection_avoided(self):
+        return sum(getattr(island, 'num_preselection_avoided', 0) for island in self.islands)
+
+    def evolve(self, generator, evaluator, pop_size=100, seeds=None, maximize=True, bounder=None, **args):
+        if args.get('resume_checkpoint') is not None:
+            raise ValueError('the island model cannot be resumed from a checkpoint')
+        if args.pop('checkpoint_filename', None) is not None:
+            logger.warning('checkpoints are not saved by the island model')
+        with futures.ThreadPoolExecutor(max_workers=len(self.islands)) as executor:
+            runs = [executor.submit(island.evolve, generator, evaluator, pop_size, seeds, maximize, bounder, **{**args, "island": k})
+                    for k, island in enumerate(self.islands)]
+            populations = [run.result() for run in runs]
+        logger.info('{0} islands evolved, {1} migrants received'.format(len(self.islands), self.migrator.migrants))
+        return [ind for population in populations for ind in population]
@@ -1,26 +1,35 @@
+import time
+IMPORT_START = time.perf_counter()
 import argparse
+import importlib
 import os
 from utils import grayToDecimal
-from bumblebee_problem_gray import UrbanPollinator as UP_gray
-from bumblebee_problem_gray_doe import UrbanPollinator as UP_gray_doe
-from bumblebee_problem_value import UrbanPollinator as UP_value
-from bumblebee_problem_value_doe import UrbanPollinator as UP_value_doe
 from multi_objective_bumblebee import run_nsga2
 from custom_variators import single_point_crossover, bit_flip_mutation, gaussian_mutation
 from inspyred.ec import variators
 from inspyred_utils import initial_pop_observer_gray, initial_pop_observer_value
 from inspyred_utils import NumpyRandomWrapper
 import logging
-import pandas as pd
-from custom_nsga2 import CustomNSGA2, CustomDoeNSGA2
+from custom_nsga2 import CustomNSGA2, CustomDoeNSGA2, CustomAsyncNSGA2, CustomSurrogateNSGA2
+from simulation_pool import SimulationPool
+from broker import SimulationBroker, AUTHKEY_VARIABLE, parseAddress
+from fitness_cache import FitnessCache
+from evaluation_store import EvaluationStore
+from cost_model import SimulationCostModel
+from checkpoint import loadCheckpoint
+from island_model import IslandModel, TOPOLOGIES
+from fused_variation import FusedVariator
+from fast_nsga import fastNsgaReplacement, fastTournamentSelection
 import collections
 collections.Iterable = collections.abc.Iterable
 collections.Sequence = collections.abc.Sequence
+# the problem modules and pandas are imported only when needed
+IMPORT_SECONDS = time.perf_counter() - IMPORT_START
 
 parser = argparse.ArgumentParser(description='Plot fitnesses of same encoding but different seeds.')
 
 parser.add_argument('-a', dest='algorithm', action='store',
-                    help='Algorithm to run: "gray", "gray_doe", "value", "value_doe". Default is "gray"', default='gray')
+                    help='Algorithm to run: "gray", "gray_doe", "gray_async", "gray_surrogate", "value", "value_doe", "value_async", "value_surrogate". Default is "gray"', default='gray')
 parser.add_argument('-c', dest='max_cores', action='store',
                     help='Maximum number of cores to use. Default is 10', default=10, type=int)
 parser.add_argument('-g', dest='generations', action='store', type=int,
@@ -29,19 +38,99 @@ parser.add_argument('-n', dest='individuals_qty', action='store', type=int,
                     help='Quantity of individuals in population. Default is 10', default=10)
 parser.add_argument('-s', dest='seed', action='store', type=int,
                     help='Seed to use. Default is 23', default=23)
-
-args = parser.parse_args()
+parser.add_argument('--extinction-check', dest='extinction_check_interval', action='store', type=int,
+                    help='Steps between two checks of the extinction of the bumblebees, which stops the simulation early. 0 disables the check. Default is one simulated day', default=None)
+parser.add_argument('--screening-years', dest='screening_years', action='store', type=int,
+                    help='Years simulated to screen the offspring, only the promising ones are simulated at full fidelity. Default is no screening', default=None)
+parser.add_argument('--screening-steps-per-day', dest='screening_steps_per_day', action='store', type=int,
+                    help='Steps per day of the screening simulations. Default is the full fidelity one', default=None)
+parser.add_argument('--screening-size', dest='screening_size', action='store', type=int,
+                    help='Side of the grid of the screening simulations. Default is the full fidelity one', default=None)
+parser.add_argument('--promotion-rate', dest='promotion_rate', action='store', type=float,
+                    help='Fraction of the screened offspring promoted to full fidelity besides the non dominated ones. Default is 0.5', default=0.5)
+parser.add_argument('--preselection-factor', dest='preselection_factor', action='store', type=int,
+                    help='Offspring bred per offspring simulated, the ones to simulate are preselected on the liveability (or on the surrogate model for the surrogate algorithms). Default is 1 (no preselection), 4 for the surrogate algorithms', default=None)
+parser.add_argument('--preselection-threshold', dest='preselection_threshold', action='store', type=float,
+                    help='Minimum estimated probability of not being dominated to simulate a preselected offspring. Default is 0', default=0)
+parser.add_argument('--bound-once', dest='bound_once', action='store_true',
+                    help='Bound the offspring once at the end of the variation instead of after every variator')
+parser.add_argument('--fused-variation', dest='fused_variation', action='store_true',
+                    help='Apply all the variators at once to the population stored as a NumPy array, for large populations')
+parser.add_argument('--fast-sorting', dest='fast_sorting', action='store_true',
+                    help='Non dominated sorting, crowding distance and tournaments with NumPy, for large populations')
+parser.add_argument('--compact-population', dest='compact_population', action='store_true',
+                    help='Keep the population in NumPy arrays instead of Individual objects between the generations, for large populations')
+parser.add_argument('--checkpoint-interval', dest='checkpoint_interval', action='store', type=int,
+                    help='Generations between two checkpoints of the run, 0 disables them. Default is 1', default=1)
+parser.add_argument('-r', dest='resume', action='store_true',
+                    help='Resume the run from its latest checkpoint, if any')
+parser.add_argument('--timeout', dest='simulation_timeout', action='store', type=float,
+                    help='Seconds after which a simulation is interrupted and its candidate excluded. Default is no timeout', default=None)
+parser.add_argument('--max-retries', dest='max_retries', action='store', type=int,
+                    help='Retries of a simulation whose worker died or hung. Default is 1', default=1)
+parser.add_argument('--max-tasks-per-worker', dest='max_tasks_per_worker', action='store', type=int,
+                    help='Simulations run by a worker before the workers are recycled. Default is no limit', default=None)
+parser.add_argument('--rss-ceiling', dest='rss_ceiling_mb', action='store', type=float,
+                    help='Resident memory (MB) of a worker that triggers the recycling of the workers. Default is no limit', default=None)
+parser.add_argument('--memory-reserve', dest='memory_reserve_mb', action='store', type=float,
+                    help='Memory (MB) of the node to keep available, fewer simulations are run at the same time when it is tight. Default is 1024', default=1024)
+parser.add_argument('--broker', dest='broker_address', action='store',
+                    help='HOST:PORT to listen on for the simulation workers (see broker.py) instead of using a local pool; the key of the workers is read from the ' + AUTHKEY_VARIABLE + ' environment variable', default=None)
+parser.add_argument('--local-workers', dest='local_workers', action='store', type=int,
+                    help='Number of workers started on this machine by the broker. Default is 0', default=0)
+parser.add_argument('--islands', dest='islands', action='store', type=int,
+                    help='Number of populations of -n individuals evolving concurrently on the same workers and exchanging their non dominated individuals. Default is 1 (no islands)', default=1)
+parser.add_argument('--migration-interval', dest='migration_interval', action='store', type=int,
+                    help='Generations between two migrations of the islands. Default is 5', default=5)
+parser.add_argument('--migrants', dest='num_migrants', action='store', type=int,
+                    help='Maximum number of non dominated individuals sent by an island to each neighbour. Default is 2', default=2)
+parser.add_argument('--topology', dest='topology', action='store', choices=TOPOLOGIES,
+                    help='Neighbours of the islands: "ring", "complete" or "random". Default is "ring"', default='ring')
+parser.add_argument('--cache', dest='cache_filename', action='store',
+                    help='SQLite file of the fitness cache shared by all the runs, empty to disable it. Default is "cache/fitness_cache.sqlite"', default=os.path.join("cache", "fitness_cache.sqlite"))
+parser.add_argument('--evaluations', dest='evaluations_filename', action='store',
+                    help='SQLite file recording every simulation with its timing and memory, empty to disable it. Default is "evaluations/evaluations.sqlite"', default=os.path.join("evaluations", "evaluations.sqlite"))
 
 
 def execute_ga(args):
+    run_name = f'{args.algorithm}_{args.individuals_qty}x{args.generations}_{args.seed}'
+    if args.islands > 1:
+        run_name = f'{args.algorithm}_{args.islands}islands_{args.individuals_qty}x{args.generations}_{args.seed}'
     ga_args = {
         "max_cores": args.max_cores,
         "seed": args.seed,
         "pop_size": args.individuals_qty,
         "max_generations": args.generations,
-        "inspyred_log_filename": os.path.join("inspyred_logs", f'inspyred_{args.algorithm}_{args.individuals_qty}x{args.generations}_{args.seed}.log'),
-        "initial_pop_filename": os.path.join("pops", f'pop_{args.algorithm}_{args.individuals_qty}x{args.generations}_{args.seed}.csv'),
-        "final_pop_filename": os.path.join("final_pops", f'final_pop_{args.algorithm}_{args.individuals_qty}x{args.generations}_{args.seed}.csv'),
+        "inspyred_log_filename": os.path.join("inspyred_logs", f'inspyred_{run_name}.log'),
+        "initial_pop_filename": os.path.join("pops", f'pop_{run_name}.csv'),
+        "final_pop_filename": os.path.join("final_pops", f'final_pop_{run_name}.csv'),
+        # the islands are not checkpointed
+        "checkpoint_filename": os.path.join("checkpoints", f'checkpoint_{run_name}.pkl') if args.islands == 1 else None,
+        "checkpoint_interval": args.checkpoint_interval,
+        "resume": args.resume,
+        "simulation_timeout": args.simulation_timeout,
+        "max_retries": args.max_retries,
+        "max_tasks_per_worker": args.max_tasks_per_worker,
+        "rss_ceiling_mb": args.rss_ceiling_mb,
+        "memory_reserve_mb": args.memory_reserve_mb,
+        "broker_address": args.broker_address,
+        "local_workers": args.local_workers,
+        "islands": args.islands,
+        "migration_interval": args.migration_interval,
+        "num_migrants": args.num_migrants,
+        "topology": args.topology,
+        "cache_filename": args.cache_filename,
+        "evaluations_filename": args.evaluations_filename,
+        "run_name": run_name,
+        "extinction_check_interval": args.extinction_check_interval,
+        "screening_fidelity": get_screening_fidelity(args),
+        "promotion_rate": args.promotion_rate,
+        "preselection_factor": args.preselection_factor,
+        "preselection_threshold": args.preselection_threshold,
+        "bound_once": args.bound_once,
+        "fused_variation": args.fused_variation,
+        "fast_sorting": args.fast_sorting,
+        "compact_population": args.compact_population,
     }
 
     # make a directory if doesn't exist
@@ -53,6 +142,18 @@ def execute_ga(args):
     ga_args = execute_ga_function(ga_args)
     execute(ga_args)
 
+def get_screening_fidelity(args):
+    if args.screening_years is None and args.screening_steps_per_day is None and args.screening_size is None:
+        return None
+    fidelity = {}
+    if args.screening_years is not None:
+        fidelity["years"] = args.screening_years
+    if args.screening_steps_per_day is not None:
+        fidelity["steps_per_day"] = args.screening_steps_per_day
+    if args.screening_size is not None:
+        fidelity["size"] = (args.screening_size, args.screening_size)
+    return fidelity
+
 def get_generic_gray_args(ga_args):
     ga_args["variations_args"] = [
         {"blx_points": [0]},
@@ -97,28 +198,52 @@ def get_generic_value_args(ga_args):
 
 def get_gray_args(ga_args):
     ga_args = get_generic_gray_args(ga_args)
-    ga_args["problem"] = UP_gray
+    ga_args["problem"] = "bumblebee_problem_gray"
     ga_args["algorithm"] = CustomNSGA2
     return ga_args
 
 def get_gray_doe_args(ga_args):
     ga_args = get_generic_gray_args(ga_args)
-    ga_args["problem"] = UP_gray_doe
+    ga_args["problem"] = "bumblebee_problem_gray_doe"
     ga_args["algorithm"] = CustomDoeNSGA2
     return ga_args
 
+def get_gray_async_args(ga_args):
+    ga_args = get_generic_gray_args(ga_args)
+    ga_args["problem"] = "bumblebee_problem_gray"
+    ga_args["algorithm"] = CustomAsyncNSGA2
+    return ga_args
+
+def get_gray_surrogate_args(ga_args):
+    ga_args = get_generic_gray_args(ga_args)
+    ga_args["problem"] = "bumblebee_problem_gray"
+    ga_args["algorithm"] = CustomSurrogateNSGA2
+    return ga_args
+
 def get_value_args(ga_args):
     ga_args = get_generic_value_args(ga_args)
-    ga_args["problem"] = UP_value
+    ga_args["problem"] = "bumblebee_problem_value"
     ga_args["algorithm"] = CustomNSGA2
     return ga_args
 
 def get_value_doe_args(ga_args):
     ga_args = get_generic_value_args(ga_args)
-    ga_args["problem"] = UP_value_doe
+    ga_args["problem"] = "bumblebee_problem_value_doe"
     ga_args["algorithm"] = CustomDoeNSGA2
     return ga_args
 
+def get_value_async_args(ga_args):
+    ga_args = get_generic_value_args(ga_args)
+    ga_args["problem"] = "bumblebee_problem_value"
+    ga_args["algorithm"] = CustomAsyncNSGA2
+    return ga_args
+
+def get_value_surrogate_args(ga_args):
+    ga_args = get_generic_value_args(ga_args)
+    ga_args["problem"] = "bumblebee_problem_value"
+    ga_args["algorithm"] = CustomSurrogateNSGA2
+    return ga_args
+
 def get_final_pop_gray(final_pop, final_pop_fitnesses):
     new_final_pop = []
     for i, guy in enumerate(final_pop):
@@ -142,6 +267,21 @@ def get_final_pop_value(final_pop, final_pop_fitnesses):
     return new_final_pop
     
 
+def load_problem(module_name):
+    # only the problem module of the selected algorithm is imported
+    start = time.perf_counter()
+    problem = importlib.import_module(module_name).UrbanPollinator
+    return problem, time.perf_counter() - start
+
+def get_backend(ga_args):
+    if ga_args.get("broker_address") is None:
+        return SimulationPool(ga_args["max_cores"], ga_args.get("max_tasks_per_worker"), ga_args.get("rss_ceiling_mb"), ga_args.get("memory_reserve_mb"))
+    authkey = os.environ.get(AUTHKEY_VARIABLE)
+    if authkey is None and ga_args.get("local_workers", 0) == 0:
+        raise ValueError(f'the {AUTHKEY_VARIABLE} environment variable must hold the key of the remote workers')
+    # without a key only the local workers can connect
+    return SimulationBroker(parseAddress(ga_args["broker_address"]), authkey.encode() if authkey is not None else None, ga_args.get("local_workers", 0))
+
 def execute(ga_args):
     # parameters for NSGA-2
     args = {}
@@ -152,31 +292,86 @@ def execute(ga_args):
 
     args["max_cores"] = ga_args["max_cores"]
     args["seed"] = ga_args["seed"]
+    args["extinction_check_interval"] = ga_args.get("extinction_check_interval")
+    args["simulation_timeout"] = ga_args.get("simulation_timeout")
+    args["max_retries"] = ga_args.get("max_retries", 1)
+    args["screening_fidelity"] = ga_args.get("screening_fidelity")
+    args["promotion_rate"] = ga_args.get("promotion_rate", 0.5)
+    if ga_args.get("preselection_factor") is not None:
+        args["preselection_factor"] = ga_args["preselection_factor"]
+    args["preselection_threshold"] = ga_args.get("preselection_threshold", 0)
+    args["bound_once"] = ga_args.get("bound_once", False)
+    args["compact_population"] = ga_args.get("compact_population", False)
+    preselection = args.get("preselection_factor", 1) > 1 or args["preselection_threshold"] > 0
 
     rng = NumpyRandomWrapper(args["seed"])
 
     args["fileName_initial_pop"] = ga_args["initial_pop_filename"]
+
+    args["checkpoint_filename"] = ga_args.get("checkpoint_filename")
+    args["checkpoint_interval"] = ga_args.get("checkpoint_interval", 1)
+    resume = ga_args.get("resume", False) and args["checkpoint_filename"] is not None and os.path.exists(args["checkpoint_filename"])
+    if resume:
+        args["resume_checkpoint"] = loadCheckpoint(args["checkpoint_filename"])
     
     logger = logging.getLogger('inspyred.ec')
     logger.setLevel(logging.DEBUG)
     log_filename = ga_args["inspyred_log_filename"]
-    file_handler = logging.FileHandler(log_filename, mode='w')
+    file_handler = logging.FileHandler(log_filename, mode='a' if resume else 'w')
     file_handler.setLevel(logging.DEBUG)
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     file_handler.setFormatter(formatter)
     logger.addHandler(file_handler)
+    if ga_args.get("resume", False) and not resume:
+        logger.warning('no checkpoint to resume from, starting a new run')
+
+    problem, problem_import_seconds = load_problem(ga_args["problem"])
+    logger.info('imports: {0:.2f} s for main.py, {1:.2f} s for {2}'.format(IMPORT_SECONDS, problem_import_seconds, ga_args["problem"]))
 
-    algorithm = ga_args["algorithm"](rng)
+    if ga_args.get("islands", 1) > 1:
+        # the islands are seeded with seed, seed + 1, ...
+        algorithm = IslandModel(ga_args["algorithm"], args["seed"], ga_args["islands"], ga_args.get("topology", "ring"),
+                                ga_args.get("migration_interval", 5), ga_args.get("num_migrants", 2))
+    else:
+        algorithm = ga_args["algorithm"](rng)
 
     algorithm.observer = ga_args["observer"]
+    if ga_args.get("fast_sorting", False):
+        algorithm.replacer = fastNsgaReplacement
+        algorithm.selector = fastTournamentSelection
+    variator = FusedVariator(ga_args["variator"]) if ga_args.get("fused_variation", False) else ga_args["variator"]
+
+    fitness_cache = FitnessCache(ga_args["cache_filename"]) if ga_args.get("cache_filename") else None
+    evaluation_store = EvaluationStore(ga_args["evaluations_filename"], run=ga_args.get("run_name")) if ga_args.get("evaluations_filename") else None
+    # the simulation times of the previous runs tell which simulations are the longest
+    cost_model = SimulationCostModel()
+    if evaluation_store is not None:
+        cost_model.load(evaluation_store)
+
+    # one pool of warmed workers (or broker) for the whole run
+    with get_backend(ga_args) as simulation_pool:
+        final_pop, final_pop_fitnesses = run_nsga2(problem(), variator, algorithm, num_vars=ga_args["num_vars"], simulation_pool=simulation_pool, fitness_cache=fitness_cache, evaluation_store=evaluation_store, cost_model=cost_model, preselection=preselection, **args)
+
+    logger.info('simulation pool: {0} restarts, {1} recycles'.format(simulation_pool.restarts, simulation_pool.recycles))
+    if getattr(algorithm, "num_preselection_avoided", 0) > 0:
+        logger.info('preselection: {0} simulations avoided'.format(algorithm.num_preselection_avoided))
 
-    final_pop, final_pop_fitnesses = run_nsga2(ga_args["problem"](), ga_args["variator"], algorithm, num_vars=ga_args["num_vars"], **args)
+    if fitness_cache is not None:
+        logger.info('fitness cache: {0} hits, {1} misses'.format(fitness_cache.hits, fitness_cache.misses))
+        fitness_cache.close()
+    if evaluation_store is not None:
+        evaluation_store.close()
     new_final_pop = ga_args["final_pop_function"](final_pop, final_pop_fitnesses)
     
+    import pandas as pd
     df = pd.DataFrame(new_final_pop, columns=['no_mow_pc', 'mowing_days', 'pesticide_days', 'flower_area_type', 'fitness_1', 'fitness_2'])
     final_pop_filename = ga_args["final_pop_filename"]
     df.to_csv(final_pop_filename, index=False)
 
 
 if __name__ == "__main__":
+    args = parser.parse_args()
+    if args.compact_population and args.algorithm.endswith('_async'):
+        # the steady state evolution keeps its individuals in the non dominated fronts
+        parser.error('--compact-population is not supported by the *_async algorithms')
     execute_ga(args)
\ No newline at end of file
@@ -0,0 +1,99 @@
+from inspyred.ec import emo
+from population_arrays import PopulationArrays
+from math import ceil
+import logging
+
+logger = logging.getLogger('inspyred.ec.multi_fidelity')
+
+def nonDominated(objectives):
+    '''
+    Indexes of the non dominated points of a list of objective tuples
+    (all the objectives are maximized).
+    '''
+    paretos = [emo.Pareto(list(o)) for o in objectives]
+    return [i for i, p in enumerate(paretos) if not any(p < q for q in paretos)]
+
+def screenFitness1(getFitness1, candidates, f2s, generation, seed, args):
+    '''
+    Multi-fidelity evaluation of the hibernated queens objective.
+
+    All the candidates are simulated at the cheap fidelity in
+    args["screening_fidelity"] (see utils.runModel). Only the candidates
+    that are non dominated with respect to the low fidelity hibernated queens
+    and the liveability, plus the best args["promotion_rate"] fraction
+    (default 0.5) by low fidelity hibernated queens, are simulated again at
+    full fidelity. The other candidates keep the low fidelity result,
+    rescaled by the full over low fidelity ratio of the promoted candidates,
+    and are added to the set args["screened_candidates"] (as tuples), if
+    given, so that the ones surviving the replacement are simulated again
+    at full fidelity by promoteSurvivors.
+
+    getFitness1: the getFitness1 method of the problem
+    candidates: candidates to evaluate
+    f2s: liveability of the candidates
+    generation: current generation
+    seed: seed (or seeds) of the simulations
+    args: dictionary of keyword arguments of the evaluator
+    '''
+    rate = args.setdefault('promotion_rate', 0.5)
+    low_f1s = getFitness1(candidates, generation, seed, {**args, "fidelity": args["screening_fidelity"]})
+
+    # the candidates whose screening failed are not promoted and stay failed
+    screened = [i for i in range(len(candidates)) if low_f1s[i] is not None]
+    ranking = sorted(screened, key=lambda i: low_f1s[i], reverse=True)
+    promoted = set(ranking[:int(ceil(rate * len(candidates)))])
+    promoted.update(screened[j] for j in nonDominated([(low_f1s[i], f2s[i]) for i in screened]))
+    promoted = sorted(promoted)
+    logger.info('screening at generation {0}: {1} of {2} candidates promoted to full fidelity'.format(generation, len(promoted), len(candidates)))
+
+    full_f1s = getFitness1([candidates[i] for i in promoted], generation, seed, args)
+
+    succeeded = [(i, f1) for i, f1 in zip(promoted, full_f1s) if f1 is not None]
+    low_total = sum(low_f1s[i] for i, f1 in succeeded)
+    scale = sum(f1 for i, f1 in succeeded) / low_total if low_total > 0 else 1
+    fitness = [f1 * scale if f1 is not None else None for f1 in low_f1s]
+    for i, f1 in zip(promoted, full_f1s):
+        fitness[i] = f1
+    screened_candidates = args.get('screened_candidates')
+    if screened_candidates is not None:
+        promoted = set(promoted)
+        screened_candidates.update(tuple(candidates[i]) for i in screened if i not in promoted)
+    return fitness
+
+def promoteSurvivors(population, evaluator, generation, args):
+    '''
+    Simulates again at full fidelity the individuals of the population whose
+    hibernated queens are a rescaled low fidelity result (the candidates in
+    args["screened_candidates"], see screenFitness1), so that the population
+    logged, archived and returned holds only full fidelity values. The set
+    is emptied, since the screened candidates not in the population are
+    discarded. Returns the population (a list, or a PopulationArrays if it
+    was one) and the number of evaluations; the individuals whose full
+    fidelity simulations fail are excluded.
+
+    population: the population after the replacement
+    evaluator: the evaluator of the problem
+    generation: current generation
+    args: dictionary of keyword arguments of the evolution
+    '''
+    screened_candidates = args.get('screened_candidates')
+    if not screened_candidates:
+        return population, 0
+    individuals = list(population)
+    indexes = [i for i, ind in enumerate(individuals) if tuple(ind.candidate) in screened_candidates]
+    screened_candidates.clear()
+    if len(indexes) == 0:
+        return population, 0
+
+    fitness = evaluator(candidates=[individuals[i].candidate for i in indexes], args={**args, "generation": generation, "screening_fidelity": None})
+    failed = set()
+    for i, fit in zip(indexes, fitness):
+        if fit is not None:
+            individuals[i].fitness = fit
+        else:
+            failed.add(i)
+    logger.info('screening at generation {0}: {1} surviving candidates simulated again at full fidelity, {2} failed'.format(generation, len(indexes), len(failed)))
+    individuals = [ind for i, ind in enumerate(individuals) if i not in failed]
+    if isinstance(population, PopulationArrays):
+        individuals = PopulationArrays.fromIndividuals(individuals)
+    return individuals, len(indexes)
@@ -1,12 +1,22 @@
-from pylab import asarray
+from numpy import asarray
 from inspyred.ec import terminators
+from preselection import liveabilityPreselection
+from population_log import PopulationLog
+from cost_model import SimulationCostModel
 
 
-def run_nsga2(problem, variator, algorithm, num_vars=0, use_bounder=True, **kwargs) :
-    """ run NSGA2 on the given problem """
+def run_nsga2(problem, variator, algorithm, num_vars=0, use_bounder=True, simulation_pool=None, fitness_cache=None, evaluation_store=None, cost_model=None, preselection=False, **kwargs) :
+    """ run NSGA2 on the given problem, evaluating on simulation_pool and
+    reusing the results stored in fitness_cache if given and recording every
+    simulation in evaluation_store if given; the simulations predicted to be
+    the longest by cost_model (a new one if not given) are submitted first;
+    with preselection
+    the offspring are preselected on the liveability (see preselection.py) """
     
-    #create dictionaries to store data about initial population, and lines
-    initial_pop_storage = []
+    #log of the populations, appended by the observers; a resumed run
+    #appends to it after dropping what was logged after the checkpoint
+    population_log = PopulationLog(kwargs["fileName_initial_pop"], append="resume_checkpoint" in kwargs,
+                                   fsync_interval=kwargs.get("population_log_fsync_interval", 10))
  
     algorithm.terminator = terminators.generation_termination 
     algorithm.variator = variator
@@ -14,13 +24,25 @@ def run_nsga2(problem, variator, algorithm, num_vars=0, use_bounder=True, **kwar
     kwargs["num_selected"]=kwargs["pop_size"]  
     if use_bounder :
         kwargs["bounder"]=problem.bounder
+    if simulation_pool is not None :
+        kwargs["simulation_pool"]=simulation_pool
+    if fitness_cache is not None :
+        kwargs["fitness_cache"]=fitness_cache
+    if evaluation_store is not None :
+        kwargs["evaluation_store"]=evaluation_store
+    kwargs["cost_model"]=cost_model if cost_model is not None else SimulationCostModel()
+    kwargs["cheap_objective"]=problem.getFitness2
+    kwargs["decoder"]=problem.decode
+    if preselection :
+        kwargs["preselector"]=liveabilityPreselection
         
-    final_pop = algorithm.evolve(evaluator=problem.evaluator,  
-                          maximize=problem.maximize,
-                          initial_pop_storage=initial_pop_storage,
-                          num_vars=num_vars, 
-                          generator=problem.generator,
-                          **kwargs) #kwargs will take also args for variators      
+    with population_log:
+        final_pop = algorithm.evolve(evaluator=problem.evaluator,  
+                              maximize=problem.maximize,
+                              population_log=population_log,
+                              num_vars=num_vars, 
+                              generator=problem.generator,
+                              **kwargs) #kwargs will take also args for variators      
     
     final_pop_fitnesses = asarray([guy.fitness for guy in final_pop])
     final_pop_candidates = [guy.candidate[0:num_vars] for guy in final_pop]
@@ -0,0 +1,148 @@
+import numpy as np
+from inspyred.ec import Individual, emo
+
+class PopulationArrays(object):
+    """Population of individuals stored as a structure of arrays.
+
+    The candidates of the problems are a no mow percentage followed by
+    small non negative integer alleles (the gray coded bits, or the days
+    and the flower area type of the value problems): they are stored as a
+    float column and a matrix of the smallest unsigned integer type of the
+    alleles (uint8 for all the problems), and the fitness values as a float
+    matrix, with one row per individual. An individual of the gray problems
+    takes 51 bytes instead of about 600 as an inspyred ``Individual``
+    with its candidate list and ``emo.Pareto`` fitness, and the whole
+    population can be decoded (``gray_codec.decodeGrayCandidates``), sorted
+    (``fast_nsga``) and logged at once.
+
+    The arrays are never modified: ``take`` and ``concatenate`` return new
+    populations. The population is a sequence of inspyred Individuals, built
+    when accessed, so the inspyred selectors, archivers and observers work
+    on it as on a list; ``candidates`` gives the candidate lists to the
+    variators and the evaluators. The individuals of a population share the
+    *maximize* of the individual and of its Pareto fitness.
+
+    Public Attributes:
+    - *no_mow_pc* -- float array of the first allele of the candidates
+    - *genes* -- unsigned integer matrix of the other alleles
+    - *fitness* -- float matrix of the fitness values
+    - *integer_fitness* -- bool array, True for the objectives with integer values
+    - *birthdate* -- float array of the birthdates of the individuals
+    - *fitness_maximize* -- maximize of the Pareto fitness, one per objective
+    - *maximize* -- maximize of the individuals
+
+    """
+    def __init__(self, no_mow_pc, genes, fitness, birthdate, integer_fitness=None, fitness_maximize=True, maximize=True):
+        self.no_mow_pc = np.asarray(no_mow_pc, dtype=float)
+        self.genes = np.asarray(genes)
+        self.fitness = np.asarray(fitness, dtype=float)
+        self.birthdate = np.asarray(birthdate, dtype=float)
+        if integer_fitness is None:
+            integer_fitness = np.zeros(self.fitness.shape[1], dtype=bool)
+        self.integer_fitness = np.asarray(integer_fitness, dtype=bool)
+        try:
+            fitness_maximize = list(fitness_maximize)
+        except TypeError:
+            fitness_maximize = [fitness_maximize] * self.fitness.shape[1]
+        self.fitness_maximize = fitness_maximize
+        self.maximize = maximize
+
+    @classmethod
+    def fromIndividuals(cls, individuals):
+        '''
+        Population of a sequence of inspyred Individuals (returned as it is
+        if it is a PopulationArrays already).
+        '''
+        if isinstance(individuals, cls):
+            return individuals
+        individuals = list(individuals)
+        if len(individuals) == 0:
+            return cls(np.zeros(0), np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 0)), np.zeros(0))
+        candidates = np.array([ind.candidate for ind in individuals], dtype=float).reshape(len(individuals), -1)
+        genes = candidates[:, 1:]
+        if np.any(genes != np.floor(genes)) or np.any(genes < 0):
+            raise ValueError('the alleles after the first one must be non negative integers')
+        values = [ind.fitness.values for ind in individuals]
+        fitness = np.array(values, dtype=float).reshape(len(individuals), -1)
+        integer_fitness = [all(isinstance(v[j], (int, np.integer)) for v in values) for j in range(fitness.shape[1])]
+        return cls(candidates[:, 0], genes.astype(np.min_scalar_type(int(genes.max(initial=0)))), fitness,
+                   [ind.birthdate for ind in individuals], integer_fitness,
+                   individuals[0].fitness.maximize, individuals[0].maximize)
+
+    def __len__(self):
+        return len(self.no_mow_pc)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            return self.individual(index)
+        return self.take(index)
+
+    def __iter__(self):
+        for candidate, values, birthdate in zip(self.candidates(), self.fitnessValues(), self.birthdate.tolist()):
+            yield self._individual(candidate, values, birthdate)
+
+    def _individual(self, candidate, values, birthdate):
+        ind = Individual(candidate, maximize=self.maximize)
+        ind.fitness = emo.Pareto(values, self.fitness_maximize)
+        ind.birthdate = birthdate
+        return ind
+
+    def individual(self, index):
+        '''
+        Individual of a row, as an inspyred Individual.
+        '''
+        candidate = [float(self.no_mow_pc[index])] + self.genes[index].tolist()
+        values = [int(v) if integer else v for v, integer in zip(self.fitness[index].tolist(), self.integer_fitness)]
+        return self._individual(candidate, values, float(self.birthdate[index]))
+
+    def candidates(self):
+        '''
+        Candidates of the individuals as new lists, as inspyred candidates.
+        '''
+        return [[no_mow_pc] + genes for no_mow_pc, genes in zip(self.no_mow_pc.tolist(), self.genes.tolist())]
+
+    def fitnessValues(self):
+        '''
+        Fitness values of the individuals as lists, with the integer
+        objectives as ints.
+        '''
+        columns = [(self.fitness[:, j].astype(np.int64) if integer else self.fitness[:, j]).tolist() for j, integer in enumerate(self.integer_fitness)]
+        return [list(values) for values in zip(*columns)]
+
+    def fitnessArrays(self):
+        '''
+        Fitness values and costs of the individuals, as
+        fast_nsga.fitnessArrays.
+        '''
+        signs = np.array([-1.0 if m == self.maximize else 1.0 for m in self.fitness_maximize])
+        return self.fitness, self.fitness * signs
+
+    def key(self, index):
+        '''
+        Hashable value of a row: equal for equal individuals.
+        '''
+        return (float(self.no_mow_pc[index]), self.genes[index].tobytes(), self.fitness[index].tobytes())
+
+    def take(self, indices):
+        '''
+        Population of the individuals at the given indexes (or mask).
+        '''
+        return PopulationArrays(self.no_mow_pc[indices], self.genes[indices], self.fitness[indices], self.birthdate[indices],
+                                self.integer_fitness, self.fitness_maximize, self.maximize)
+
+    @property
+    def nbytes(self):
+        return self.no_mow_pc.nbytes + self.genes.nbytes + self.fitness.nbytes + self.birthdate.nbytes
+
+def concatenate(populations):
+    '''
+    Population of the individuals of several populations, in order.
+    '''
+    populations = [p for p in populations if len(p) > 0] or list(populations[:1])
+    first = populations[0]
+    return PopulationArrays(np.concatenate([p.no_mow_pc for p in populations]),
+                            np.concatenate([p.genes for p in populations]),
+                            np.concatenate([p.fitness for p in populations]),
+                            np.concatenate([p.birthdate for p in populations]),
+                            np.logical_and.reduce([p.integer_fitness for p in populations]),
+                            first.fitness_maximize, first.maximize)
@@ -0,0 +1,77 @@
+import csv
+import os
+import threading
+
+POPULATION_LOG_COLUMNS = ['generation', 'island', 'no_mow_pc', 'mowing_days', 'pesticide_days', 'flower_area_type', 'fitness_1', 'fitness_2']
+
+class PopulationLog(object):
+    """Append-only CSV log of the populations of a run.
+
+    Each generation only its own rows are appended to the open file, so the
+    memory used is constant and the I/O of a generation is proportional to
+    the population size. The file is flushed after every generation and
+    synced to disk every *fsync_interval* generations (see ``sync``). The
+    islands of island_model.py append to the same log from their threads,
+    one generation at a time under the lock, and the island column tells
+    their rows apart (0 without islands).
+
+    Public Attributes:
+    - *filename* -- path of the CSV file
+    - *fsync_interval* -- generations between two syncs to disk, 0 disables them
+    - *num_generations* -- number of generations appended, of all the islands
+
+    """
+    def __init__(self, filename, append=False, fsync_interval=10):
+        self.filename = filename
+        self.fsync_interval = fsync_interval
+        self.num_generations = 0
+        if os.path.dirname(filename):
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+        self.file = open(filename, 'a' if append else 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.lock = threading.Lock()
+        if self.file.tell() == 0:
+            self.writer.writerow(POPULATION_LOG_COLUMNS)
+            self.file.flush()
+
+    def append(self, generation, rows, island=0):
+        '''
+        Appends the rows (no_mow_pc, mowing_days, pesticide_days,
+        flower_area_type, fitness_1, fitness_2) of a generation of an island.
+        '''
+        with self.lock:
+            self.writer.writerows([generation, island, *row] for row in rows)
+            self.file.flush()
+            self.num_generations += 1
+            if self.fsync_interval > 0 and self.num_generations % self.fsync_interval == 0:
+                os.fsync(self.file.fileno())
+
+    def sync(self):
+        '''
+        Writes the log to disk and returns its size in bytes.
+        '''
+        with self.lock:
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            return self.file.tell()
+
+    def truncate(self, size):
+        '''
+        Drops everything written after the given size (see ``sync``), e.g. the
+        generations logged after the checkpoint a run is resumed from.
+        '''
+        with self.lock:
+            self.file.flush()
+            self.file.truncate(size)
+            self.file.seek(size)
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
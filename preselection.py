@@ -0,0 +1,51 @@
+import logging
+
+logger = logging.getLogger('inspyred.ec.preselection')
+
+def nonDominationProbability(liveability, population):
+    '''
+    Estimated probability that an offspring with the given liveability is not
+    dominated by the population, whatever its hibernated queens quantity.
+    The offspring must beat the best hibernated queens quantity M of the
+    individuals at least as liveable as it; the probability of exceeding M
+    is estimated from the hibernated queens of the population, leaving room
+    for one better value never observed: (#{f1 > M} + 1) / (n + 1).
+    '''
+    if len(population) == 0:
+        return 1.0
+    f1s = [ind.fitness[0] for ind in population]
+    better = [ind.fitness[0] for ind in population if ind.fitness[1] >= liveability]
+    if len(better) == 0:
+        return 1.0
+    best = max(better)
+    return (sum(1 for f1 in f1s if f1 > best) + 1) / (len(f1s) + 1)
+
+def liveabilityPreselection(candidates, population, args):
+    '''
+    Returns the offspring worth simulating among an oversized pool, using
+    only the cheap liveability objective.
+
+    The candidates are sorted by their probability of not being dominated by
+    the population (see nonDominationProbability) and then by liveability;
+    the candidates with probability lower than args["preselection_threshold"]
+    (default 0) are dropped, unless needed to keep args["min_offspring"]
+    (default 0), and at most args["num_offspring"] are kept.
+
+    candidates: oversized pool of offspring
+    population: current population (individuals with fitness)
+    args: dictionary of keyword arguments, "cheap_objective" is the function
+        returning the liveabilities of a list of candidates
+    '''
+    threshold = args.setdefault('preselection_threshold', 0)
+    num_offspring = args.setdefault('num_offspring', len(candidates))
+    min_offspring = args.setdefault('min_offspring', 0)
+    liveabilities = args['cheap_objective'](candidates)
+    probabilities = [nonDominationProbability(l, population) for l in liveabilities]
+
+    order = sorted(range(len(candidates)), key=lambda i: (probabilities[i], liveabilities[i]), reverse=True)
+    survivors = [i for i in order if probabilities[i] >= threshold][:num_offspring]
+    if len(survivors) < min_offspring:
+        survivors = order[:min_offspring]
+    # keep the order in which the offspring were bred
+    survivors.sort()
+    return [candidates[i] for i in survivors]
@@ -0,0 +1,624 @@
+import concurrent.futures as futures
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from collections import deque
+from utils import runModel, fidelityKey
+from cost_model import predictMakespan
+import logging
+import multiprocessing
+import os
+import resource
+import signal
+import threading
+import time
+import traceback
+
+logger = logging.getLogger('inspyred.ec.simulation_pool')
+
+# seconds between two checks of the simulations under way
+POLL_INTERVAL = 1.0
+
+# modules imported once by the fork server of the workers (see workerContext)
+WORKER_PRELOAD = ['mesa', 'pandas', 'bumblebee_pollination_abm.Model', 'utils', 'simulation_pool']
+
+class SimulationTimeout(Exception):
+    pass
+
+class SimulationsCancelled(Exception):
+    pass
+
+def warmWorker():
+    '''
+    Initializer of the simulation workers: it imports once the heavy modules
+    (Mesa, the bumblebee model and pandas) so that the first simulation
+    submitted to a worker doesn't pay for them. The workers forked by the
+    fork server already have them.
+    '''
+    import mesa
+    import pandas
+    import bumblebee_pollination_abm.Model
+    import utils
+
+def workerContext():
+    '''
+    Multiprocessing context of the simulation workers. Where available it
+    is forkserver: the fork server is a template process that imports the
+    WORKER_PRELOAD modules once, and every worker (also the ones replacing
+    restarted or recycled workers) is forked from it already warm, without
+    the modules of the main process (e.g. inspyred, the evolution state)
+    and without inheriting its threads. Elsewhere the workers are spawned
+    and warmed by warmWorker.
+    '''
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload(WORKER_PRELOAD)
+        return context
+    return multiprocessing.get_context('spawn')
+
+def availableMemoryMB():
+    '''
+    Memory available on the node for new processes, None if unknown (it is
+    read from /proc/meminfo, so only on Linux).
+    '''
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+def currentRssMB():
+    '''
+    Current resident memory of this process, None if unknown.
+    '''
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * resource.getpagesize() / (1024 * 1024)
+    except OSError:
+        return None
+
+class EvaluationBackend(object):
+    """Interface of the backends running the simulations (see ``runJobs``).
+
+    A backend runs functions on its workers and returns
+    ``concurrent.futures.Future`` objects; ``SimulationPool`` runs them on
+    local processes and ``broker.SimulationBroker`` on worker processes
+    connected through sockets, also from other machines.
+
+    The simulations under way are accounted by the backend (see
+    ``reserve``), so that several callers of ``runJobs`` sharing it, e.g.
+    the asynchronous evaluations or the islands of island_model.py, never
+    submit more simulations than can be under way.
+
+    Public Attributes:
+    - *max_cores* -- number of simulations the backend can run at the same time
+    - *in_flight* -- number of simulations under way, of all the callers
+    - *restarts* -- number of times the simulations under way were abandoned
+
+    """
+    max_cores = 1
+
+    def __init__(self):
+        self.in_flight = 0
+        self.restarts = 0
+        self.waiting_alone = 0
+        self.running_alone = False
+        self.slots = threading.Condition()
+
+    def reserve(self, wanted, timeout=0, alone=False, cancel=None):
+        '''
+        Takes up to *wanted* of the free slots for simulations (see
+        ``capacity``) and returns how many were taken, waiting up to
+        *timeout* seconds (None for no limit) for one to get free. Every
+        slot taken is given back with ``release``.
+
+        With *alone* one slot is taken only when no simulation is under
+        way, and no other slot is given until it is released, so that the
+        simulation runs alone on the backend also when several callers
+        share it.
+
+        With a *cancel* event, nothing is taken once it is set: the wait
+        is ended within POLL_INTERVAL seconds.
+        '''
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        with self.slots:
+            if alone:
+                self.waiting_alone += 1
+            try:
+                while True:
+                    if cancel is not None and cancel.is_set():
+                        free = 0
+                        break
+                    if alone:
+                        free = 1 if self.in_flight == 0 else 0
+                    elif self.waiting_alone > 0 or self.running_alone:
+                        free = 0
+                    else:
+                        free = self.capacity(self.in_flight) - self.in_flight
+                    remaining = deadline - time.monotonic() if deadline is not None else None
+                    if free > 0 or (remaining is not None and remaining <= 0):
+                        break
+                    if cancel is not None:
+                        remaining = POLL_INTERVAL if remaining is None else min(remaining, POLL_INTERVAL)
+                    self.slots.wait(remaining)
+            finally:
+                if alone:
+                    self.waiting_alone -= 1
+            taken = max(0, min(wanted, free))
+            self.in_flight += taken
+            if alone and taken > 0:
+                self.running_alone = True
+            return taken
+
+    def release(self, count=1):
+        with self.slots:
+            self.in_flight -= count
+            if self.in_flight == 0:
+                self.running_alone = False
+            self.slots.notify_all()
+
+    def restartOnce(self, restarts):
+        '''
+        Restarts the backend unless another caller already did it after
+        *restarts* (the restarts when the interrupted simulations were
+        submitted), and returns True if it was restarted now.
+        '''
+        with self.slots:
+            if self.restarts != restarts:
+                return False
+            self.restart()
+            return True
+
+    def submit(self, fn, *args, **kwargs):
+        '''
+        Schedules fn(*args, **kwargs) on a worker and returns its Future.
+        A Future whose worker is lost for good gets a BrokenProcessPool.
+        '''
+        raise NotImplementedError
+
+    def capacity(self, running):
+        '''
+        Number of simulations that can be under way, given the *running* ones.
+        '''
+        return self.max_cores
+
+    def taskDone(self, metrics):
+        '''
+        Accounts a simulation ended on a worker (metrics of runModelMeasured).
+        '''
+        pass
+
+    def restart(self):
+        '''
+        Abandons the simulations under way, killing their workers if
+        possible, and cancels the pending ones.
+        '''
+        raise NotImplementedError
+
+    def shutdown(self, wait=True):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        return False
+
+class SimulationPool(EvaluationBackend):
+    """Long lived pool of local simulation workers.
+
+    The pool is created once per run (see ``main.execute``) and it is
+    shared by every call of the problem evaluators, so that processes are
+    started and warmed only once instead of once per generation; they are
+    forked from a warm template process (see ``workerContext``).
+
+    If a worker dies (segfault, out of memory killer) or hangs, the pool
+    is restarted with fresh workers (see ``restart`` and ``runJobs``).
+
+    The memory grown by the workers over long runs is bounded by recycling
+    them (see ``recycle``) once a worker has run *max_tasks_per_worker*
+    simulations or its resident memory exceeds *rss_ceiling_mb*. With
+    *memory_reserve_mb* fewer simulations are run at the same time when the
+    memory available on the node is tight (see ``capacity``).
+
+    Public Attributes:
+    - *max_cores* -- maximum number of worker processes
+    - *max_tasks_per_worker* -- simulations run by a worker before recycling (None for no limit)
+    - *rss_ceiling_mb* -- resident memory of a worker that triggers recycling (None for no limit)
+    - *memory_reserve_mb* -- memory of the node to keep available (None to ignore the node memory)
+    - *executor* -- the underlying ``ProcessPoolExecutor``
+    - *restarts* -- number of times the workers were killed and replaced
+    - *recycles* -- number of times the workers were recycled
+    - *task_memory_mb* -- largest resident memory of a worker after a simulation
+
+    """
+    def __init__(self, max_cores=8, max_tasks_per_worker=None, rss_ceiling_mb=None, memory_reserve_mb=None):
+        self.max_cores = max_cores
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.rss_ceiling_mb = rss_ceiling_mb
+        self.memory_reserve_mb = memory_reserve_mb
+        super().__init__()
+        self.recycles = 0
+        self.task_memory_mb = 0
+        self.worker_tasks = {}
+        self.retiring = []
+        self.throttled = False
+        self.executor = self.newExecutor()
+
+    def newExecutor(self):
+        return futures.ProcessPoolExecutor(max_workers=self.max_cores, mp_context=workerContext(), initializer=warmWorker)
+
+    def submit(self, fn, *args, **kwargs):
+        # the executor is replaced under the same lock by recycle and restart
+        with self.slots:
+            return self.executor.submit(fn, *args, **kwargs)
+
+    def capacity(self, running):
+        '''
+        Number of simulations that can be under way, given the *running*
+        ones: a new simulation is started only if the memory available on
+        the node minus the memory of a simulation stays above the reserve,
+        but at least one simulation can always run.
+        '''
+        if self.memory_reserve_mb is None or self.task_memory_mb == 0:
+            return self.max_cores
+        available = availableMemoryMB()
+        if available is None:
+            return self.max_cores
+        # the running simulations already hold their memory
+        extra = int((available - self.memory_reserve_mb) // self.task_memory_mb)
+        allowed = max(1, min(self.max_cores, running + extra))
+        if (allowed < self.max_cores) != self.throttled:
+            self.throttled = allowed < self.max_cores
+            logger.info('simulations under way limited to {0} ({1:.0f} MB available, {2:.0f} MB per simulation)'.format(
+                allowed, available, self.task_memory_mb))
+        return allowed
+
+    def taskDone(self, metrics):
+        '''
+        Accounts a simulation ended on a worker (metrics of runModelMeasured)
+        and recycles the workers if the worker reached its limits.
+        '''
+        if metrics is None:
+            return
+        rss = metrics.get("rss_mb")
+        pid = metrics["pid"]
+        with self.slots:
+            if rss is not None:
+                self.task_memory_mb = max(self.task_memory_mb, rss)
+            if pid not in self.worker_tasks:
+                # the simulations ended by recycled workers don't count
+                if pid not in [p.pid for p in (self.executor._processes or {}).values()]:
+                    return
+                self.worker_tasks[pid] = 0
+            self.worker_tasks[pid] += 1
+            if self.max_tasks_per_worker is not None and self.worker_tasks[pid] >= self.max_tasks_per_worker:
+                self.recycle('worker {0} ran {1} simulations'.format(pid, self.worker_tasks[pid]))
+            elif self.rss_ceiling_mb is not None and rss is not None and rss > self.rss_ceiling_mb:
+                self.recycle('worker {0} uses {1:.0f} MB'.format(pid, rss))
+
+    def recycle(self, reason=''):
+        '''
+        Replaces the workers with fresh ones without interrupting anything:
+        the old workers end the simulations under way and then exit.
+        '''
+        # under the lock of submit, so nothing is submitted to the old workers
+        with self.slots:
+            self.executor.shutdown(wait=False)
+            self.retiring.append(self.executor)
+            self.retiring = [e for e in self.retiring if any(p.is_alive() for p in (e._processes or {}).values())]
+            self.executor = self.newExecutor()
+            self.worker_tasks = {}
+            self.recycles += 1
+        logger.info('simulation workers recycled: {0} ({1} recycles)'.format(reason, self.recycles))
+
+    def restart(self):
+        '''
+        Kills the workers, also the hung ones and the recycled ones still
+        running, and replaces them with fresh ones. The futures still
+        pending are cancelled or broken.
+        '''
+        # ProcessPoolExecutor has no public way to kill a running task
+        with self.slots:
+            executors = self.retiring + [self.executor]
+            processes = [p for e in executors for p in (e._processes or {}).values()]
+            for process in processes:
+                process.terminate()
+            for executor in executors:
+                executor.shutdown(wait=False, cancel_futures=True)
+            for process in processes:
+                process.join()
+            self.retiring = []
+            self.executor = self.newExecutor()
+            self.worker_tasks = {}
+            self.restarts += 1
+        logger.warning('simulation pool restarted ({0} restarts)'.format(self.restarts))
+
+    def shutdown(self, wait=True):
+        with self.slots:
+            executors = self.retiring + [self.executor]
+        for executor in executors:
+            executor.shutdown(wait=wait)
+
+def raiseTimeout(signum, frame):
+    raise SimulationTimeout()
+
+def runModelMeasured(job, generation, check_interval=None, timeout=None):
+    '''
+    Runs utils.runModel in the worker and returns the SimulationResult (None
+    if the simulation failed), the status ("ok", "error" if the simulation
+    raised an exception, "timeout" if it didn't end in *timeout* seconds),
+    the text of the exception and the measured "wall_time", "cpu_time",
+    "peak_rss_mb" (peak of the worker so far), "rss_mb" (memory of the
+    worker at the end) and "pid".
+    '''
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+    if timeout:
+        signal.signal(signal.SIGALRM, raiseTimeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        result = runModel(job, generation, check_interval)
+        status, error = "ok", None
+    except SimulationTimeout:
+        result = None
+        status, error = "timeout", f"SimulationTimeout: simulation not ended in {timeout} seconds"
+    except Exception:
+        result = None
+        status, error = "error", traceback.format_exc()
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    metrics = {
+        "wall_time": time.perf_counter() - start_wall,
+        "cpu_time": time.process_time() - start_cpu,
+        # ru_maxrss is in kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "rss_mb": currentRssMB(),
+        "pid": os.getpid()
+    }
+    return result, status, error, metrics
+
+def runJobs(pool, jobs, generation, check_interval=None, timeout=None, max_retries=1, onInterrupted=None, costs=None, cancel=None):
+    '''
+    Runs runModelMeasured on the pool for every job and returns the outcomes
+    (result, status, error, metrics) in the same order of the jobs. With the
+    predicted *costs* of the jobs, the most expensive ones are submitted
+    first (longest processing time first), so that a long simulation
+    submitted last doesn't set the makespan.
+
+    The simulations are submitted only on the slots taken from the pool
+    (see EvaluationBackend.reserve), so every submitted simulation is under
+    way also when several calls share the pool, and the pool accounts every
+    ended simulation (see SimulationPool.taskDone). A simulation running for more than
+    *timeout* seconds is interrupted by its worker; if the worker doesn't
+    respond within twice the timeout, it is considered hung. When a worker
+    dies or hangs, the pool is restarted and the simulations under way are
+    run again alone on the fresh workers, so that the one
+    responsible can be told apart: it is retried at most *max_retries*
+    times and then it fails with status "crashed" or "timeout". The errors
+    raised by the model are not retried, since the simulations are
+    deterministic. The pool is restarted once also when the calls sharing
+    it see the same crash.
+
+    onInterrupted: function called with the index of the job, the status
+        and the error of every interrupted attempt that is retried, e.g. to
+        record it
+    cancel: threading.Event that stops the call when set: the simulations
+        not started are dropped, the ones under way are cancelled and
+        SimulationsCancelled is raised
+    '''
+    outcomes = [None] * len(jobs)
+    attempts = [0] * len(jobs)
+    if costs is not None:
+        queue = deque(sorted(range(len(jobs)), key=lambda i: -costs[i]))
+    else:
+        queue = deque(range(len(jobs)))
+    isolated = deque()
+    running = {}
+    hang_timeout = 2 * timeout if timeout else None
+
+    def submit(i):
+        attempts[i] += 1
+        future = pool.submit(runModelMeasured, jobs[i], generation, check_interval, timeout)
+        # the restarts tell the simulations interrupted by an earlier restart
+        running[future] = (i, time.monotonic(), pool.restarts)
+
+    # slots taken from the pool and not given back yet: all of them are
+    # given back on every exit, also when the pool or a callback raises
+    held = 0
+    try:
+        while len(queue) > 0 or len(isolated) > 0 or len(running) > 0:
+            if cancel is not None and cancel.is_set():
+                raise SimulationsCancelled('generation {0}: {1} simulations cancelled'.format(generation, len(queue) + len(isolated) + len(running)))
+            # wait for a slot only if there is nothing else to wait for
+            wait = POLL_INTERVAL if len(running) == 0 else 0
+            # the retried simulations run alone, also on a shared pool
+            if len(isolated) > 0:
+                if len(running) == 0 and pool.reserve(1, None, alone=True, cancel=cancel) > 0:
+                    held += 1
+                    submit(isolated.popleft())
+            elif len(queue) > 0:
+                taken = pool.reserve(len(queue), wait, cancel=cancel)
+                held += taken
+                for _ in range(taken):
+                    submit(queue.popleft())
+            if len(running) == 0:
+                continue
+
+            done, _ = futures.wait(running, timeout=POLL_INTERVAL, return_when=futures.FIRST_COMPLETED)
+            broken = None
+            broken_restarts = 0
+            interrupted = []
+            for future in done:
+                i, start, restarts = running.pop(future)
+                pool.release()
+                held -= 1
+                try:
+                    outcomes[i] = future.result()
+                    pool.taskDone(outcomes[i][3])
+                except (BrokenProcessPool, futures.CancelledError) as ex:
+                    interrupted.append(i)
+                    broken = ("crashed", repr(ex))
+                    broken_restarts = max(broken_restarts, restarts)
+            now = time.monotonic()
+            if broken is None and hang_timeout is not None and any(now - start > hang_timeout and restarts == pool.restarts for i, start, restarts in running.values()):
+                broken = ("timeout", f"SimulationTimeout: worker not responding after {hang_timeout} seconds")
+                broken_restarts = pool.restarts
+
+            if broken is not None:
+                status, error = broken
+                # if another call already restarted the pool, only the
+                # simulations broken by that restart are interrupted
+                if pool.restartOnce(broken_restarts):
+                    interrupted.extend(i for i, start, restarts in running.values())
+                    pool.release(len(running))
+                    held -= len(running)
+                    running = {}
+                for i in interrupted:
+                    if attempts[i] > max_retries:
+                        outcomes[i] = (None, status, error, None)
+                    else:
+                        if onInterrupted is not None:
+                            onInterrupted(i, status, error)
+                        isolated.append(i)
+                logger.warning('generation {0}: {1} simulations interrupted ({2}), {3} to retry'.format(generation, len(interrupted), status, len(isolated)))
+    finally:
+        for future in running:
+            future.cancel()
+        if held > 0:
+            pool.release(held)
+
+    return outcomes
+
+@contextmanager
+def getPool(pool=None, max_cores=8):
+    '''
+    Yields the shared backend if given, otherwise a temporary pool that is
+    shut down on exit (used by the standalone ga_*.py scripts).
+    '''
+    if pool is not None:
+        yield pool
+    else:
+        with SimulationPool(max_cores) as temp_pool:
+            yield temp_pool
+
+def jobKey(job):
+    '''
+    Key of a simulation: two jobs with the same key give the same result.
+    '''
+    return (
+        fidelityKey(job.get("fidelity")),
+        int(job["seed"]),
+        float(job["no_mow_pc"]),
+        int(job["mowing_days"]),
+        int(job["pesticide_days"]),
+        int(job["flower_area_type"])
+    )
+
+def runSimulations(jobs, generation, args=None):
+    '''
+    Runs one simulation per distinct job and returns the hibernated queens
+    quantities in the same order of the jobs. A failed simulation (see
+    runJobs) gives None, so that the candidate is excluded by the evolution.
+    Identical jobs are simulated once and the result is copied to all of them.
+    Jobs found in the cache are not submitted to the pool, and the results of
+    the simulations terminated correctly are added to the cache. Every
+    simulation run is recorded in the evaluation store, if given.
+
+    jobs: list of dictionaries with the arguments of utils.runModel
+    generation: current generation
+    args: dictionary of keyword arguments of the evaluator, it may contain
+        "simulation_pool": the shared EvaluationBackend (a temporary SimulationPool is created if missing),
+        "max_cores": number of workers of the temporary pool (default 8),
+        "fitness_cache": a FitnessCache,
+        "evaluation_store": an EvaluationStore,
+        "cost_model": a cost_model.SimulationCostModel, to submit the longest simulations first,
+        "extinction_check_interval": steps between two extinction checks (see utils.runModel),
+        "simulation_timeout": seconds after which a simulation fails (default None, no timeout),
+        "max_retries": retries of a simulation whose worker died or hung (default 1),
+        "fidelity": fidelity of the simulations, full fidelity if missing (see utils.runModel),
+        "cancel_event": threading.Event that cancels the simulations when set (see runJobs)
+    '''
+    if args is None:
+        args = {}
+    pool = args.get('simulation_pool')
+    max_cores = args.get('max_cores', 8)
+    cache = args.get('fitness_cache')
+    store = args.get('evaluation_store')
+    cost_model = args.get('cost_model')
+    check_interval = args.get('extinction_check_interval')
+    timeout = args.get('simulation_timeout')
+    max_retries = args.get('max_retries', 1)
+    cancel = args.get('cancel_event')
+    if args.get('fidelity') is not None:
+        jobs = [{**job, "fidelity": args['fidelity']} for job in jobs]
+
+    fitness = [None] * len(jobs)
+
+    # group identical jobs, the first one of each group is the one simulated
+    copies = {}
+    for i, job in enumerate(jobs):
+        copies.setdefault(jobKey(job), []).append(i)
+    unique = [indexes[0] for indexes in copies.values()]
+    saved = len(jobs) - len(unique)
+    if saved > 0:
+        print(f"Skipped {saved} duplicated simulations")
+    logger.info('duplicated simulations at generation {0}: {1} of {2} jobs'.format(generation, saved, len(jobs)))
+
+    to_run = []
+    for i in unique:
+        cached = cache.get(jobs[i]) if cache is not None else None
+        if cached is not None:
+            fitness[i] = cached
+        else:
+            to_run.append(i)
+
+    if cache is not None:
+        logger.info('fitness cache at generation {0}: {1} hits, {2} misses (total {3} hits, {4} misses)'.format(
+            generation, len(unique) - len(to_run), len(to_run), cache.hits, cache.misses))
+
+    if len(to_run) > 0:
+        def onInterrupted(k, status, error):
+            print(f"Process {to_run[k]} interrupted: [{error}]")
+            if store is not None:
+                store.record(jobs[to_run[k]], generation, None, None, error, status)
+
+        costs = cost_model.predict([jobs[i] for i in to_run]) if cost_model is not None else None
+        start = time.perf_counter()
+        with getPool(pool, max_cores) as executor:
+            predicted = predictMakespan(sorted(costs, reverse=True), executor.max_cores) if costs is not None else None
+            outcomes = runJobs(executor, [jobs[i] for i in to_run], generation, check_interval, timeout, max_retries, onInterrupted, costs, cancel)
+        makespan = time.perf_counter() - start
+        if predicted is not None:
+            logger.info('makespan at generation {0}: predicted {1:.1f} s, actual {2:.1f} s for {3} simulations'.format(generation, predicted, makespan, len(to_run)))
+        else:
+            logger.info('makespan at generation {0}: {1:.1f} s for {2} simulations'.format(generation, makespan, len(to_run)))
+
+        failed = 0
+        for i, (result, status, error, metrics) in zip(to_run, outcomes):
+            if store is not None:
+                store.record(jobs[i], generation, result, metrics, error, status)
+            if result is not None:
+                fitness[i] = result.hibernated_queens
+                print(f"Process {i} terminated correctly at step {result.steps}")
+                if cost_model is not None:
+                    cost_model.update(jobs[i], metrics["wall_time"])
+                if cache is not None:
+                    cache.put(jobs[i], result.hibernated_queens)
+            else:
+                print(f"Error in process {i} ({status}): [{error.strip().splitlines()[-1]}]")
+                failed += 1
+        if failed > 0:
+            logger.warning('failed simulations at generation {0}: {1} of {2}'.format(generation, failed, len(to_run)))
+        if store is not None:
+            store.flush()
+
+    for indexes in copies.values():
+        for i in indexes[1:]:
+            fitness[i] = fitness[indexes[0]]
+
+    return fitness
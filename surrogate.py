@@ -0,0 +1,163 @@
+import numpy as np
+from math import erf, sqrt
+import logging
+
+logger = logging.getLogger('inspyred.ec.surrogate')
+
+# upper bounds of the decoded parameters used to scale them in [0, 1]
+PARAMS_SCALE = np.array([1, 190, 190, 7])
+
+class GaussianProcess(object):
+    """Gaussian process regression with a squared exponential kernel.
+
+    The inputs are expected to be scaled in [0, 1] and the outputs are
+    standardized before fitting. The length scale and the noise are chosen
+    on a small grid by maximizing the log marginal likelihood.
+
+    Public Attributes:
+    - *length_scales* -- candidate length scales of the kernel
+    - *noises* -- candidate noise variances (of the standardized outputs)
+    - *length_scale* -- the chosen length scale
+    - *noise* -- the chosen noise variance
+
+    """
+    def __init__(self, length_scales=(0.05, 0.1, 0.2, 0.5, 1.0), noises=(1e-3, 1e-2, 1e-1, 0.5)):
+        self.length_scales = length_scales
+        self.noises = noises
+        self.length_scale = None
+        self.noise = None
+
+    def kernel(self, A, B, length_scale):
+        distances = ((A[:, None, :] - B[None, :, :]) ** 2).sum(axis=2)
+        return np.exp(-0.5 * distances / length_scale ** 2)
+
+    def fit(self, X, y):
+        self.X = np.asarray(X, dtype=float)
+        y = np.asarray(y, dtype=float)
+        self.y_mean = y.mean()
+        self.y_std = y.std() if y.std() > 0 else 1.0
+        y = (y - self.y_mean) / self.y_std
+
+        best = None
+        for length_scale in self.length_scales:
+            K = self.kernel(self.X, self.X, length_scale)
+            for noise in self.noises:
+                try:
+                    L = np.linalg.cholesky(K + noise * np.eye(len(y)))
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+                likelihood = -0.5 * y.dot(alpha) - np.log(np.diag(L)).sum()
+                if best is None or likelihood > best[0]:
+                    best = (likelihood, length_scale, noise, L, alpha)
+        _, self.length_scale, self.noise, self.L, self.alpha = best
+        return self
+
+    def predict(self, X):
+        '''
+        Returns the predicted mean and standard deviation of the outputs.
+        '''
+        X = np.asarray(X, dtype=float)
+        K_s = self.kernel(X, self.X, self.length_scale)
+        mean = K_s.dot(self.alpha)
+        v = np.linalg.solve(self.L, K_s.T)
+        variance = np.clip(1 + self.noise - (v ** 2).sum(axis=0), 1e-12, None)
+        return mean * self.y_std + self.y_mean, np.sqrt(variance) * self.y_std
+
+class HibernatedQueensSurrogate(object):
+    """Surrogate model of the hibernated queens of the simulations.
+
+    It records every evaluated candidate (see ``recording``) and it is
+    retrained on the evaluation history before each preselection, at most
+    once per generation.
+
+    Public Attributes:
+    - *decoder* -- function returning the decoded parameters of a candidate
+    - *max_history* -- maximum number of evaluations used for training
+    - *min_history* -- minimum number of evaluations to use the model
+    - *history_X* -- scaled decoded parameters of the evaluated candidates
+    - *history_y* -- hibernated queens of the evaluated candidates
+    - *model* -- the GaussianProcess, None until trained
+
+    """
+    def __init__(self, decoder, max_history=500, min_history=10):
+        self.decoder = decoder
+        self.max_history = max_history
+        self.min_history = min_history
+        self.history_X = []
+        self.history_y = []
+        self.model = None
+        self.trained_size = 0
+
+    def scale(self, candidates):
+        return np.array([self.decoder(c) for c in candidates], dtype=float) / PARAMS_SCALE
+
+    def recording(self, evaluator):
+        '''
+        Wraps the evaluator so that every evaluated candidate is recorded.
+        '''
+        def _evaluator(candidates, args):
+            fitness = evaluator(candidates=candidates, args=args)
+            for c, fit in zip(candidates, fitness):
+                if fit is not None:
+                    self.history_X.append(self.scale([c])[0])
+                    self.history_y.append(fit[0])
+            return fitness
+        _evaluator.__name__ = evaluator.__name__
+        return _evaluator
+
+    def train(self):
+        if len(self.history_y) < self.min_history:
+            return None
+        if self.model is None or self.trained_size != len(self.history_y):
+            X = np.array(self.history_X[-self.max_history:])
+            y = np.array(self.history_y[-self.max_history:])
+            self.model = GaussianProcess().fit(X, y)
+            self.trained_size = len(self.history_y)
+            logger.info('surrogate trained on {0} evaluations (length scale {1}, noise {2})'.format(len(y), self.model.length_scale, self.model.noise))
+        return self.model
+
+    def predict(self, candidates):
+        return self.model.predict(self.scale(candidates))
+
+def surrogateInfill(candidates, population, args):
+    '''
+    Preselector of the surrogate-assisted mode: returns the offspring to
+    simulate among an oversized pool.
+
+    For each offspring the surrogate in args["surrogate"] predicts the
+    hibernated queens mean mu and standard deviation sigma; with the
+    liveability l (args["cheap_objective"]) the infill criterion is the
+    probability of not being dominated by the population,
+    P(f1 > M(l)) = 1 - Phi((M(l) - mu) / sigma), where M(l) is the best
+    hibernated queens quantity of the individuals at least as liveable.
+    The offspring with probability lower than args["infill_threshold"]
+    (default 0.05) are not simulated and at most args["num_offspring"],
+    with the highest probabilities, are kept. Until the surrogate has enough
+    evaluations the first args["num_offspring"] offspring are kept.
+    '''
+    threshold = args.setdefault('infill_threshold', 0.05)
+    num_offspring = args.setdefault('num_offspring', len(candidates))
+    min_offspring = args.setdefault('min_offspring', 0)
+    model = args['surrogate'].train()
+    if model is None or len(population) == 0:
+        return candidates[:num_offspring]
+
+    liveabilities = args['cheap_objective'](candidates)
+    mean, std = args['surrogate'].predict(candidates)
+    probabilities = []
+    for l, mu, sigma in zip(liveabilities, mean, std):
+        better = [ind.fitness[0] for ind in population if ind.fitness[1] >= l]
+        if len(better) == 0:
+            probabilities.append(1.0)
+        else:
+            z = (max(better) - mu) / sigma
+            probabilities.append(0.5 * (1 - erf(z / sqrt(2))))
+
+    order = sorted(range(len(candidates)), key=lambda i: probabilities[i], reverse=True)
+    survivors = [i for i in order if probabilities[i] >= threshold][:num_offspring]
+    if len(survivors) < min_offspring:
+        survivors = order[:min_offspring]
+    # keep the order in which the offspring were bred
+    survivors.sort()
+    return [candidates[i] for i in survivors]
@@ -0,0 +1,10 @@
+import collections
+import collections.abc
+import os
+import sys
+
+# inspyred 1.0.1 still uses the aliases removed in Python 3.10 (as main.py)
+collections.Iterable = collections.abc.Iterable
+collections.Sequence = collections.abc.Sequence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,37 @@
+import threading
+import pytest
+
+pytest.importorskip("bumblebee_pollination_abm")
+
+from inspyred.ec import terminators, variators
+from custom_nsga2 import CustomAsyncNSGA2
+from custom_variators import gaussian_mutation
+from inspyred_utils import NumpyRandomWrapper
+from simulation_pool import SimulationPool
+from bumblebee_problem_gray import UrbanPollinator
+
+# cheap simulations, the test is about the scheduling
+TEST_FIDELITY = {"years": 1, "steps_per_day": 2, "size": (10, 10)}
+
+def test_async_evolution_with_recycled_workers_terminates():
+    problem = UrbanPollinator()
+    algorithm = CustomAsyncNSGA2(NumpyRandomWrapper(1))
+    algorithm.terminator = terminators.generation_termination
+    algorithm.variator = [variators.blend_crossover, gaussian_mutation]
+    outcome = {}
+
+    with SimulationPool(4, max_tasks_per_worker=1) as pool:
+        def run():
+            outcome["population"] = algorithm.evolve(
+                generator=problem.generator, evaluator=problem.evaluator, maximize=problem.maximize,
+                bounder=problem.bounder, pop_size=12, max_generations=6, max_cores=4,
+                variations_args=[{"blx_points": [0]}, {"g_points": [0], "gaussian_stdev": 0.1}],
+                simulation_pool=pool, fidelity=TEST_FIDELITY)
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        thread.join(timeout=600)
+        assert not thread.is_alive(), "the asynchronous evolution didn't terminate"
+        assert pool.in_flight == 0
+        assert pool.recycles > 0
+    assert len(outcome["population"]) > 0
@@ -0,0 +1,119 @@
+from multiprocessing.connection import Client
+import threading
+import time
+import pytest
+
+pytest.importorskip("bumblebee_pollination_abm")
+
+from broker import SimulationBroker
+
+HEARTBEAT_INTERVAL = 0.1
+HEARTBEAT_TIMEOUT = 0.5
+
+class ProtocolWorker(object):
+    """Worker speaking the protocol of broker.workerLoop from threads of the
+    test, so that it can miss its heartbeats or never end a task.
+
+    The results are (name of the worker, result of the task); the tasks
+    for which *hold* is True (called with their number, from 1) never end.
+    """
+    def __init__(self, broker, name, heartbeat=True, hold=lambda number: False):
+        self.connection = Client(broker.address, authkey=broker.authkey)
+        self.name = name
+        self.hold = hold
+        self.received = []
+        self.send_lock = threading.Lock()
+        self.closed = False
+        threading.Thread(target=self.run, daemon=True).start()
+        if heartbeat:
+            threading.Thread(target=self.heartbeat, daemon=True).start()
+
+    def send(self, message):
+        with self.send_lock:
+            self.connection.send(message)
+
+    def heartbeat(self):
+        while not self.closed:
+            time.sleep(HEARTBEAT_INTERVAL)
+            try:
+                self.send(("heartbeat",))
+            except (OSError, ValueError):
+                return
+
+    def run(self):
+        self.send(("ready",))
+        while True:
+            try:
+                message = self.connection.recv()
+            except Exception:
+                # dropped by the broker, or closed by close while waiting
+                return
+            if message[0] == "stop":
+                return
+            _, task_id, fn, args, kwargs = message
+            self.received.append(task_id)
+            if not self.hold(len(self.received)):
+                self.send(("result", task_id, (self.name, fn(*args, **kwargs))))
+
+    def close(self):
+        self.closed = True
+        self.connection.close()
+
+def waitFor(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+@pytest.fixture
+def broker():
+    broker = SimulationBroker(('127.0.0.1', 0), heartbeat_interval=HEARTBEAT_INTERVAL, heartbeat_timeout=HEARTBEAT_TIMEOUT)
+    yield broker
+    broker.shutdown()
+
+def connect(broker, *args, **kwargs):
+    connected = len(broker.workers)
+    worker = ProtocolWorker(broker, *args, **kwargs)
+    waitFor(lambda: len(broker.workers) > connected)
+    return worker
+
+def test_silent_worker_is_dropped_and_its_task_requeued(broker):
+    silent = connect(broker, "silent", heartbeat=False, hold=lambda number: True)
+    future = broker.submit(pow, 2, 10)
+    waitFor(lambda: len(silent.received) == 1)
+
+    # no heartbeat for HEARTBEAT_TIMEOUT seconds
+    waitFor(lambda: len(broker.workers) == 0)
+    assert broker.requeued == 1
+    assert not future.done()
+
+    healthy = connect(broker, "healthy")
+    assert future.result(timeout=10) == ("healthy", 1024)
+    silent.close()
+    healthy.close()
+
+def test_disconnected_worker_task_is_requeued(broker):
+    lost = connect(broker, "lost", hold=lambda number: True)
+    future = broker.submit(pow, 3, 3)
+    waitFor(lambda: len(lost.received) == 1)
+    lost.close()
+    waitFor(lambda: len(broker.workers) == 0)
+    assert broker.requeued == 1
+
+    healthy = connect(broker, "healthy")
+    assert future.result(timeout=10) == ("healthy", 27)
+    healthy.close()
+
+def test_idle_worker_steals_a_straggler(broker):
+    # the first task sets the mean duration, the second one never ends
+    straggler = connect(broker, "straggler", hold=lambda number: number > 1)
+    assert broker.submit(pow, 2, 2).result(timeout=10) == ("straggler", 4)
+    future = broker.submit(pow, 2, 5)
+    waitFor(lambda: len(straggler.received) == 2)
+
+    thief = connect(broker, "thief")
+    assert future.result(timeout=10) == ("thief", 32)
+    assert broker.requeued == 0
+    assert len(broker.tasks) == 0
+    straggler.close()
+    thief.close()
@@ -0,0 +1,29 @@
+import itertools
+import numpy as np
+import pytest
+
+pytest.importorskip("bumblebee_pollination_abm")
+
+from utils import FLOWER_AREA_TYPE_POINTS, getLiveability, getLiveabilityBatch
+
+# the batch differs from the scalar version only in the last bits of np.tanh
+TOLERANCE = 1e-12
+
+def test_batch_matches_scalar():
+    no_mow_pc = [0, 0.05, 0.333, 0.5, 0.999, 1]
+    days = [0, 1, 30, 59, 60, 61, 94, 120, 189]
+    cases = list(itertools.product(no_mow_pc, days, days, FLOWER_AREA_TYPE_POINTS))
+    x1, x2, x3, x4 = (np.array(column) for column in zip(*cases))
+    expected = [getLiveability(*case) for case in cases]
+    np.testing.assert_allclose(getLiveabilityBatch(x1, x2, x3, x4), expected, rtol=0, atol=TOLERANCE)
+
+def test_batch_broadcasts_scalars():
+    np.testing.assert_allclose(getLiveabilityBatch(0.5, [10, 100], 70, 2),
+                               [getLiveability(0.5, 10, 70, 2), getLiveability(0.5, 100, 70, 2)], rtol=0, atol=TOLERANCE)
+
+@pytest.mark.parametrize("flower_area_type", [-1, 7, 2.5, np.nan])
+def test_batch_rejects_unknown_flower_area_type(flower_area_type):
+    with pytest.raises(KeyError):
+        getLiveability(0.5, 10, 10, flower_area_type)
+    with pytest.raises(KeyError):
+        getLiveabilityBatch([0.5, 0.5], [10, 10], [10, 10], [1, flower_area_type])
@@ -1,18 +1,43 @@
 from typing import List
 import numpy as np
-from bumblebee_pollination_abm.Model import GreenArea
 from bumblebee_pollination_abm.Utils import PlantType, BeeType, BeeStage
 from math import tanh
+from enum import Enum
+import hashlib
+import json
+import sys
+from collections import namedtuple
+from gray_codec import decodeGray, encodeGray
 
-def getModel(no_mow_pc, mowing_days, pesticide_days, flower_area_type, seed):
-    size = (50, 50)
+SIMULATED_YEARS = 3
+# fidelity of the simulations used for the fitness, cheaper fidelities
+# can be used for screening (see multi_fidelity.py)
+FULL_FIDELITY = {"years": SIMULATED_YEARS, "steps_per_day": 40, "size": (50, 50)}
+# classes of the colony and bumblebee (queens included) agents, as named in
+# the module of the model, see bumblebeeAgentTypes
+BUMBLEBEE_AGENT_CLASSES = ("ColonyAgent", "BeeAgent")
+
+SimulationResult = namedtuple('SimulationResult', ['hibernated_queens', 'steps'])
+
+def getFidelity(fidelity=None):
+    '''
+    Returns the full fidelity updated with the given (partial) fidelity.
+    '''
+    return {**FULL_FIDELITY, **(fidelity or {})}
+
+def fidelityKey(fidelity=None):
+    '''
+    Hashable key of the (partial) fidelity.
+    '''
+    return tuple(sorted((k, str(v)) for k, v in getFidelity(fidelity).items()))
 
+def getModelParams(no_mow_pc, mowing_days, pesticide_days, flower_area_type, seed, steps_per_day=40, size=(50, 50)):
     model_params = {
         "width": size[0], 
         "height": size[1], 
         "queens_quantity": 2, 
         "no_mow_pc": no_mow_pc,
-        "steps_per_day": 40,
+        "steps_per_day": steps_per_day,
         "mowing_days": mowing_days,
         "pesticide_days": pesticide_days,
         "false_year_duration": 190, #false duration of the year withouth hibernation period
@@ -99,9 +124,40 @@ def getModel(no_mow_pc, mowing_days, pesticide_days, flower_area_type, seed):
         "seed": seed
     }
 
-    return GreenArea(**model_params)
+    return model_params
+
+def getModel(no_mow_pc, mowing_days, pesticide_days, flower_area_type, seed):
+    from bumblebee_pollination_abm.Model import GreenArea
+    return GreenArea(**getModelParams(no_mow_pc, mowing_days, pesticide_days, flower_area_type, seed))
+
+def canonicalParams(params):
+    '''
+    Converts the model parameters in a json serializable structure
+    (enum keys and values become strings, tuples become lists).
+    '''
+    if isinstance(params, dict):
+        return {str(canonicalParams(k)): canonicalParams(v) for k, v in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [canonicalParams(v) for v in params]
+    if isinstance(params, Enum):
+        return str(params)
+    return params
+
+def getModelParamsHash(fidelity=None):
+    '''
+    Hash of the parameters of the simulation that don't depend on the candidate
+    nor on the seed. It changes whenever getModelParams or the fidelity
+    change, so that cached fitnesses of another model are not reused.
+    '''
+    fidelity = getFidelity(fidelity)
+    params = getModelParams(None, None, None, None, None, fidelity["steps_per_day"], fidelity["size"])
+    for key in ["no_mow_pc", "mowing_days", "pesticide_days", "flower_area_type", "seed"]:
+        del params[key]
+    params["simulated_years"] = fidelity["years"]
+    params = json.dumps(canonicalParams(params), sort_keys=True)
+    return hashlib.sha256(params.encode()).hexdigest()
 
-def runModel(args, generation):
+def runModel(args, generation, check_interval=None):
     '''
     args:
         "no_mow_pc": percentage of area not mowed, it is a value between 0 and 1;
@@ -117,17 +173,75 @@ def runModel(args, generation):
                 6: flower area in the west section, 
                 7: flower area in the east section
             )
+        "seed": seed of the simulation;
+        "fidelity": optional dictionary with "years", "steps_per_day" and "size"
+            of the simulation, missing values are taken from FULL_FIDELITY
+    generation: current generation
+    check_interval: steps between two extinction checks, default is one day.
+        The simulation stops as soon as the bumblebees are extinct, since
+        the hibernated queens quantity can only be 0. Use 0 to never stop.
+
+    Returns a SimulationResult with the hibernated queens quantity and the
+    number of simulated steps.
     '''
 
-    model = getModel(**args)
-    # 7600 steps per year
-    for i in range(22800): # 3 years
+    # the model (and Mesa) is imported by the workers only, see simulation_pool.warmWorker
+    from bumblebee_pollination_abm.Model import GreenArea
+    args = dict(args)
+    fidelity = getFidelity(args.pop("fidelity", None))
+    model_params = getModelParams(**args, steps_per_day=fidelity["steps_per_day"], size=fidelity["size"])
+    model = GreenArea(**model_params)
+    # 7600 steps per year at full fidelity
+    year_steps = model_params["false_year_duration"] * model_params["steps_per_day"]
+    steps = fidelity["years"] * year_steps
+    if check_interval is None:
+        check_interval = model_params["steps_per_day"]
+    # if the agents aren't recognized only the end of the years is checked
+    track_agents = countBumblebeeAgents(model) > 0
+
+    step = 0
+    while step < steps:
         model.step()
+        step += 1
+        if check_interval and step < steps and step % check_interval == 0:
+            if (track_agents or step % year_steps == 0) and isExtinct(model, track_agents):
+                break
 
     if model.data_collection:
         saveData(model, generation)
 
-    return model.getHibernatedQueensQuantity()
+    return SimulationResult(model.getHibernatedQueensQuantity(), step)
+
+def bumblebeeAgentTypes(model):
+    '''
+    Classes of the colony and bumblebee agents of the model, taken from the
+    module of the model (bumblebee_pollination_abm.Model imports them to
+    create the agents), or an empty tuple if any of them is missing.
+    '''
+    module = sys.modules.get(type(model).__module__)
+    types = tuple(getattr(module, name, None) for name in BUMBLEBEE_AGENT_CLASSES)
+    return types if all(isinstance(t, type) for t in types) else ()
+
+def countBumblebeeAgents(model):
+    '''
+    Number of colonies and bumblebees (queens included) scheduled in the
+    model, 0 if their classes are not known (see bumblebeeAgentTypes).
+    '''
+    schedule = getattr(model, "schedule", None)
+    types = bumblebeeAgentTypes(model)
+    if schedule is None or len(types) == 0:
+        return 0
+    return sum(1 for agent in schedule.agents if isinstance(agent, types))
+
+def isExtinct(model, track_agents=True):
+    '''
+    True if there isn't any hibernated queen and, when track_agents is True,
+    any colony or bumblebee alive. Without track_agents it must be called at
+    the end of a year, when the surviving queens are hibernated.
+    '''
+    if model.getHibernatedQueensQuantity() > 0:
+        return False
+    return not track_agents or countBumblebeeAgents(model) == 0
 
 def saveData(model, generation):
     col_ag_df = model.datacollector_colonies.get_agent_vars_dataframe()
@@ -150,23 +264,10 @@ def saveData(model, generation):
     )
 
 def grayToDecimal(n: List[int]) -> int:
-	n = ''.join(str(i) for i in n)
-	n = int(n, 2)
-	binary = 0
-
-	# Taking xor until n becomes zero
-	while (n):
-		binary = binary ^ n
-		n = n >> 1
-
-	return binary
+    return decodeGray(n)
 
 def grayCode(n: int, bits: int) -> List[int]:
-    gray = n ^ (n >> 1)
-    gray = bin(gray)[2:]
-    gray_list = list(map(int, gray))
-    gray_list = [0] * (bits - len(gray_list)) + gray_list
-    return gray_list
+    return encodeGray(n, bits)
 
 def lhs_generator(random, args):
     lower_bounds = args["min"]
@@ -185,16 +286,18 @@ def lhs_generator(random, args):
       points = points[0]
     return np.array(points)
 
+FLOWER_AREA_TYPE_POINTS = { # 0 is the best, 1 is the worst
+    0: 0.1, #centered square
+    1: 0.1, #centered circle
+    2: 0.4, #north and south
+    3: 0.2, #north
+    4: 0.2, #south
+    5: 0.2, #west
+    6: 0.2 #east
+}
+
 def getLiveability(x1,x2,x3,x4):
-    flower_area_type_points = { # 0 is the best, 1 is the worst
-        0: 0.1, #centered square
-        1: 0.1, #centered circle
-        2: 0.4, #north and south
-        3: 0.2, #north
-        4: 0.2, #south
-        5: 0.2, #west
-        6: 0.2 #east
-    }
+    flower_area_type_points = FLOWER_AREA_TYPE_POINTS
     alpha1 = 0.8
     alpha2 = 0.2
     beta1 = 1.5
@@ -213,4 +316,45 @@ def getLiveability(x1,x2,x3,x4):
     w = (beta1*x3)/m3 if x3 <= t3 else (beta1*t3)/m3 + tanh((x3-t3)*beta2/m3)*((m3 - beta1*t3)/m3)
     e = (gamma1*g*x2)/m2 + g if x2 <= t2 else g + (gamma1*g*t2)/m2 + tanh((x2-t2)*gamma2/m2)*(((m2 - gamma1*g*t2)/m2) - g)
     f2 = 1 - (alpha1*e + alpha2*w)
-    return f2
\ No newline at end of file
+    return f2
+
+def getLiveabilityBatch(x1, x2, x3, x4):
+    '''
+    Liveability of many candidates at once, same as getLiveability applied
+    to every element of the arrays (or scalars, broadcasted) of no mow
+    percentages x1, mowing days x2, pesticide days x3 (both minus 1) and
+    flower area types x4 (0 to 6). Returns an array of float, equal to the
+    values of getLiveability but for the last bit of the tanh. Raises
+    KeyError, as getLiveability, if a flower area type is not one of
+    FLOWER_AREA_TYPE_POINTS.
+    '''
+    x1 = np.asarray(x1, dtype=float)
+    x2 = np.asarray(x2, dtype=float)
+    x3 = np.asarray(x3, dtype=float)
+    x4 = np.asarray(x4)
+    # fancy indexing would wrap the negative types and truncate the fractional ones
+    invalid = ~np.isin(x4, list(FLOWER_AREA_TYPE_POINTS))
+    if invalid.any():
+        raise KeyError(x4[invalid].flat[0].item())
+    flower_area_type_points = np.array([FLOWER_AREA_TYPE_POINTS[i] for i in range(len(FLOWER_AREA_TYPE_POINTS))])
+    alpha1 = 0.8
+    alpha2 = 0.2
+    beta1 = 1.5
+    beta2 = 25
+    kappa1 = 0.75
+    kappa2 = 0.25
+    s1 = x1
+    s2 = flower_area_type_points[x4.astype(int)]
+    g = np.where((s1 == 1) | (s2 == 1), 1.0, kappa1*s1 + kappa2*s2)
+    t2 = 60/(1+g)
+    t3 = 60
+    m2 = 189
+    m3 = 189
+    # g is 0 only if both the points are 0, then gamma1 is 0 as in getLiveability
+    safe_g = np.where(g != 0, g, 1.0)
+    gamma1 = np.where(g != 0, 0.1 * (1 - g) * (m2/(t2*safe_g)), 0.0)
+    gamma2 = 5
+    w = np.where(x3 <= t3, (beta1*x3)/m3, (beta1*t3)/m3 + np.tanh((x3-t3)*beta2/m3)*((m3 - beta1*t3)/m3))
+    e = np.where(x2 <= t2, (gamma1*g*x2)/m2 + g, g + (gamma1*g*t2)/m2 + np.tanh((x2-t2)*gamma2/m2)*(((m2 - gamma1*g*t2)/m2) - g))
+    f2 = 1 - (alpha1*e + alpha2*w)
+    return f2